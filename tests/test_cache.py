@@ -0,0 +1,119 @@
+import os
+import pickle
+
+from click.testing import CliRunner
+
+from wewcompiler.backend.rustvm import cache
+from wewcompiler.backend.rustvm import compile as compile_command
+from wewcompiler.backend.rustvm.cache import CACHE_FORMAT, CacheWriter, cache_key, cache_path, load_cached
+
+
+def test_key_changes_with_inputs():
+    """Changing the source, register count or stdlib inclusion changes the key."""
+    key = cache_key("fn main() {}", 10, True)
+
+    assert key == cache_key("fn main() {}", 10, True)
+    assert key != cache_key("fn main() { 1; }", 10, True)
+    assert key != cache_key("fn main() {}", 4, True)
+    assert key != cache_key("fn main() {}", 10, False)
+
+
+def test_key_changes_with_compiler(monkeypatch):
+    """Changing the compiler itself changes the key."""
+    key = cache_key("fn main() {}", 10, True)
+
+    monkeypatch.setattr(cache, "compiler_fingerprint", lambda: "a different compiler")
+    assert key != cache_key("fn main() {}", 10, True)
+
+
+def test_store_and_load(tmp_path, monkeypatch):
+    """A stored entry is loaded back as it was written."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    assert load_cached("key") is None
+
+    with CacheWriter("key", {"main": 4}, (1, 2)) as entry:
+        entry.write(b"\x01")
+        entry.write(b"\x02")
+    assert load_cached("key") == ({"main": 4}, (1, 2), b"\x01\x02")
+
+
+def test_store_incomplete(tmp_path, monkeypatch):
+    """An entry is only stored once the binary is complete."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    entry = CacheWriter("key", {}, (0, 0))
+    entry.write(b"\x01")
+    assert load_cached("key") is None
+    entry.commit()
+    assert load_cached("key") == ({}, (0, 0), b"\x01")
+
+    try:
+        with CacheWriter("key", {}, (0, 0)) as entry:
+            entry.write(b"\x02")
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    assert load_cached("key") == ({}, (0, 0), b"\x01")
+    assert os.listdir(os.path.dirname(cache_path("key"))) == [os.path.basename(cache_path("key"))]
+
+
+def test_store_disabled(tmp_path, monkeypatch):
+    """A writer without a key writes nothing."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+    with CacheWriter(None, {}, (0, 0)) as entry:
+        entry.write(b"\x01")
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_load_other_format(tmp_path, monkeypatch):
+    """Entries written with a different format are treated as a miss."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    os.makedirs(os.path.dirname(cache_path("key")))
+
+    with open(cache_path("key"), "wb") as f:
+        f.write(bytes((CACHE_FORMAT + 1,)))
+        f.write(pickle.dumps(({}, (0, 0))))
+    assert load_cached("key") is None
+
+
+def test_load_corrupt(tmp_path, monkeypatch):
+    """Empty or corrupt entries are treated as a miss."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    os.makedirs(os.path.dirname(cache_path("key")))
+
+    for data in (b"", bytes((CACHE_FORMAT,)) + b"not a pickle"):
+        with open(cache_path("key"), "wb") as f:
+            f.write(data)
+        assert load_cached("key") is None
+
+
+def test_store_unwritable(tmp_path, monkeypatch):
+    """Failing to write an entry is silent."""
+    # the cache directory can't be created underneath a file
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(blocker))
+
+    with CacheWriter("key", {}, (0, 0)) as entry:
+        entry.write(b"\x01")
+    assert load_cached("key") is None
+
+
+def test_cli_cached_output(tmp_path, monkeypatch):
+    """The compiler prints and writes the same thing whether or not the binary was cached."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    source = tmp_path / "in.wew"
+    source.write_text("var a := 1; fn main() { a = 2; }")
+
+    runs = []
+    for _ in range(2):
+        out = tmp_path / "out.bin"
+        result = CliRunner().invoke(compile_command, [str(source), str(out), "--no-include-std"])
+        assert result.exit_code == 0, result.output
+        runs.append((result.output, out.read_bytes()))
+
+    assert os.listdir(str(tmp_path / "cache" / "a-compiler"))
+    assert runs[0] == runs[1]
+    assert "Function count: " in runs[0][0]
@@ -1,4 +1,6 @@
-from wewcompiler.backend.rustvm import compile_and_pack
+from wewcompiler.backend.rustvm import assemble_instructions, compile_and_pack
+from wewcompiler.backend.rustvm.encoder import HardWareInstruction, HardwareMemoryLocation
+from wewcompiler.objects import builder, parse_cached, types
 from wewcompiler.objects.errors import CompileException
 
 from pytest import raises
@@ -430,6 +432,18 @@ def test_array_lit_no_const():
     compile(decl)
 
 
+@for_feature(pointers="Pointers", arrays="Arrays")
+def test_ptr_array_lit_storage():
+    """Test that pointer array literals reserve space for all of their elements."""
+    decl = emptyfn("var x: |*|*u8|| = {{1, 2}, {3, 4}};")
+    _, compiler = compile(decl)
+    fn, = (i for i in compiler.compiled_objects if getattr(i, "name", None) == "test")
+
+    # one pointer for each inner array, each inner literal reserves an 8 byte slot per element
+    sizes = sorted(var.size for name, var in fn.vars.items() if name != "x")
+    assert sizes == sorted([2 * types.Pointer.size, 2 * 8, 2 * 8])
+
+
 @for_feature(pointers="Pointers", arrays="Arrays")
 def test_array_indexes_no_void():
     """Assert that it is not possible to use void pointers inside array indexing operations."""
@@ -641,3 +655,39 @@ def test_call_nonfn():
 
     with raises(CompileException):
         compile(decl)
+
+
+@for_feature(register_allocation="Register Allocation", globals="Globals")
+def test_toplevel_spills():
+    """Make sure spills in toplevel code are placed into the global spill variables."""
+    x = "1"
+    for _ in range(49):
+        x = f"(1 + {x})"
+
+    (offsets, code), compiler = compile(f"var a: u8 = {x};")
+
+    assert compiler.spill_vars
+
+    # every spill variable is placed and the spilling code references each of them
+    spill_offsets = {offsets[var.name] for var in compiler.spill_vars}
+    referenced = {arg.index
+                  for instr in code if isinstance(instr, HardWareInstruction)
+                  for arg in instr.args if isinstance(arg, HardwareMemoryLocation)}
+    assert spill_offsets <= referenced
+
+
+def test_compile_same_source_twice():
+    """Test that compiling the same source twice gives the same output and leaves the cached parse untouched."""
+    decl = ('var g := "global";'
+            + emptyfn("var a := {1, 2};"
+                      "return a[1] + 3;"))
+
+    (offsets_first, code_first), _ = compile(decl)
+    (offsets_second, code_second), _ = compile(decl)
+
+    assert offsets_first == offsets_second
+    assert assemble_instructions(code_first) == assemble_instructions(code_second)
+
+    # compile adds the main function to the source
+    cached = parse_cached(decl + "fn main() {}", builder.WewSemantics)
+    assert all(i.context is None and not hasattr(i, "_coro") for i in cached)
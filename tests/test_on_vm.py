@@ -5,9 +5,10 @@ from wewcompiler.backend.rustvm import compile_and_pack, assemble_instructions
 from tests.helpers import for_feature
 
 
-def run_code_on_vm(location: int, value: int, size: int, program: str, binary_location: str):
+def run_code_on_vm(location: int, value: int, size: int, program: str, binary_location: str,
+                   reg_count: int = 10):
 
-    (_, code), _ = compile_and_pack(program)
+    (_, code), _ = compile_and_pack(program, reg_count)
     compiled = assemble_instructions(code)
 
     proc = subprocess.run(
@@ -21,11 +22,12 @@ def run_code_on_vm(location: int, value: int, size: int, program: str, binary_lo
         raise Exception(f"Test failed: {proc.stdout}")
 
 
-def expect(location: int, value: int, size: int = 2):
+def expect(location: int, value: int, size: int = 2, reg_count: int = 10):
     """Wrapper for testing some source on the VM.
 
     The substring '{dest}' in the source is replaced with the string '*({location}::*u{size})'
     Where {location} is the provided memory location and {size} is the size to read.
+    The program is compiled for {reg_count} registers.
 
     For example:
     @expect(1000, 1234, 8)
@@ -39,7 +41,7 @@ def expect(location: int, value: int, size: int = 2):
         @pytest.mark.usefixtures("binloc")
         def more_wrappers(binloc):
             program = func().replace("{dest}", f"*({location}::*u{size})")
-            run_code_on_vm(location, value, size, program, binloc)
+            run_code_on_vm(location, value, size, program, binloc, reg_count)
 
         # copy the doc and name across, but not the signature as doing so breaks
         # pytest's inspections
@@ -445,6 +447,18 @@ def test_ptr_arr():
     """
 
 
+@for_feature(arrays="Arrays", register_allocation="Register Allocation")
+@expect(5000, 3, 8, reg_count=3)
+def test_ptr_arr_few_registers():
+    """Check that spills don't overwrite the elements of arrays as pointers."""
+    return """
+    fn main() {
+        var x: |*|*u8|| = {{1, 2}, {3, 4}};
+        {dest} = x[1][0];
+    }
+    """
+
+
 @for_feature(register_allocation="Register Allocation")
 @expect(5000, 50, 8)
 def test_force_spills_to_happen_large_expression():
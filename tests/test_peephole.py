@@ -0,0 +1,189 @@
+from wewcompiler.backend.rustvm import compile_and_pack
+from wewcompiler.backend.rustvm.encoder import (BinaryInstructions, HardWareInstruction,
+                                                HardwareRegister, Manip, Mem)
+from wewcompiler.backend.rustvm.peephole import is_redundant, peephole
+from wewcompiler.objects.ir_object import Dereference, Immediate, JumpTarget
+
+a, b, c = map(HardwareRegister, range(4, 7))
+
+
+def mov(to, from_, size=8) -> HardWareInstruction:
+    return HardWareInstruction(Manip.mov, size, (to, from_))
+
+
+def push(arg, size=8) -> HardWareInstruction:
+    return HardWareInstruction(Mem.push, size, (arg,))
+
+
+def pop(arg, size=8) -> HardWareInstruction:
+    return HardWareInstruction(Mem.pop, size, (arg,))
+
+
+def binary(op, left, right, to, size=8) -> HardWareInstruction:
+    return HardWareInstruction(op, size, (left, right, to))
+
+
+def add(left, right, to, size=8) -> HardWareInstruction:
+    return binary(BinaryInstructions.add, left, right, to, size)
+
+
+def test_redundant_add_zero():
+    """Adding zero to a register in place is dropped."""
+    assert is_redundant(add(a, Immediate(0, 8), a))
+    assert peephole([add(a, Immediate(0, 8), a)]) == []
+
+
+def test_redundant_add_zero_kept():
+    """Adding zero is kept when it moves the value or truncates it."""
+    assert not is_redundant(add(a, Immediate(0, 8), b))
+    assert not is_redundant(add(a, Immediate(1, 8), a))
+    assert not is_redundant(add(a, Immediate(0, 4), a, size=4))
+
+
+def test_redundant_self_move():
+    """An 8 byte move of a register to itself is dropped, smaller moves truncate so are kept."""
+    assert is_redundant(mov(a, a))
+    assert not is_redundant(mov(a, a, size=4))
+    assert not is_redundant(mov(a, Dereference(a, 8)))
+
+
+def test_mov_mov_overwritten():
+    """A move overwritten by the next move is dropped."""
+    code = [mov(a, b), mov(a, c)]
+    assert peephole(code) == [mov(a, c)]
+
+
+def test_mov_mov_overwritten_reads_dest():
+    """A move is kept if the next move reads the destination."""
+    code = [mov(a, b), mov(a, Dereference(a, 8))]
+    assert peephole(code) == code
+
+
+def test_mov_mov_write_back():
+    """Moving a value straight back to where it came from is dropped."""
+    code = [mov(a, b), mov(b, a)]
+    assert peephole(code) == [mov(a, b)]
+
+
+def test_mov_mov_write_back_sizes():
+    """Writing back is kept when the sizes differ or a smaller move truncated the register."""
+    code = [mov(a, b), mov(b, a, size=4)]
+    assert peephole(code) == code
+
+    code = [mov(a, b, size=4), mov(b, a, size=4)]
+    assert peephole(code) == code
+
+
+def test_mov_mov_write_back_memory():
+    """A value loaded from memory and stored back to the same location is dropped at any size."""
+    code = [mov(a, Dereference(b, 2), size=2), mov(Dereference(b, 2), a, size=2)]
+    assert peephole(code) == [code[0]]
+
+
+def test_mov_mov_write_back_reads_dest():
+    """Writing back is kept if the source reads the destination register."""
+    code = [mov(a, Dereference(a, 8)), mov(Dereference(a, 8), a)]
+    assert peephole(code) == code
+
+
+def test_push_pop():
+    """A push immediately popped back into the same register is dropped."""
+    assert peephole([push(a), pop(a)]) == []
+
+
+def test_push_pop_kept():
+    """A push popped into a different register or at a different size is kept."""
+    code = [push(a), pop(b)]
+    assert peephole(code) == code
+
+    code = [push(a, size=4), pop(a, size=4)]
+    assert peephole(code) == code
+
+
+def test_jump_target_breaks_window():
+    """Nothing is rewritten across a jump target."""
+    for first, second in ((mov(a, b), mov(a, c)),
+                          (mov(a, b), mov(b, a)),
+                          (push(a), pop(a))):
+        code = [first, JumpTarget(), second]
+        assert peephole(code) == code
+
+
+def test_unexpected_operand_count():
+    """Instructions without the operand count a rule expects are left alone."""
+    code = [HardWareInstruction(Manip.mov, 8, (a,)), mov(a, b)]
+    assert peephole(code) == code
+
+    code = [HardWareInstruction(Mem.push, 8, (a, a)), pop(a)]
+    assert peephole(code) == code
+
+    code = [HardWareInstruction(BinaryInstructions.add, 8, (a, Immediate(0, 8)))]
+    assert peephole(code) == code
+
+
+def test_unexpected_operand_count_asm():
+    """Inline asm with unusual operand counts compiles."""
+    compile_and_pack("fn main() { var a: u8 = 1; _asm[ mov:8, <0>; mov:8, <0>, <0>; ] {a}; }")
+    compile_and_pack("fn main() { var a: u8 = 1; _asm[ push:8, <0>, <0>; pop:8, <0>; ] {a}; }")
+    compile_and_pack("fn main() { var a: u8 = 1; _asm[ mov:8, <0>, <0>; add:8, <0>, <0>; ] {a}; }")
+
+
+def test_mov_binary_full_width():
+    """An 8 byte move into the destination of an operation folds into it for every operation."""
+    for op in BinaryInstructions:
+        assert peephole([mov(a, b), binary(op, a, c, a)]) == [binary(op, b, c, a)]
+        assert peephole([mov(a, b), binary(op, c, a, a)]) == [binary(op, c, b, a)]
+
+
+def test_mov_binary_low_bytes():
+    """Below 8 bytes operations whose low bytes only depend on the low bytes of the operands fold."""
+    for op in (BinaryInstructions.add, BinaryInstructions.sub, BinaryInstructions.mul,
+               BinaryInstructions.and_, BinaryInstructions.or_, BinaryInstructions.xor):
+        for size in (1, 2, 4):
+            code = [mov(a, b, size=size), binary(op, a, c, a, size=size)]
+            assert peephole(code) == [binary(op, b, c, a, size=size)]
+
+            code = [mov(a, b, size=size), binary(op, c, a, a, size=size)]
+            assert peephole(code) == [binary(op, c, b, a, size=size)]
+
+
+def test_mov_binary_low_bytes_shift():
+    """Below 8 bytes a shifted value folds but a shift count is read at full width so doesn't."""
+    for size in (1, 2, 4):
+        code = [mov(a, b, size=size), binary(BinaryInstructions.shl, a, c, a, size=size)]
+        assert peephole(code) == [binary(BinaryInstructions.shl, b, c, a, size=size)]
+
+        code = [mov(a, b, size=size), binary(BinaryInstructions.shl, c, a, a, size=size)]
+        assert peephole(code) == code
+
+
+def test_mov_binary_truncating_ops_kept():
+    """Below 8 bytes operations that see the truncated bytes of the move are not folded."""
+    for op in (BinaryInstructions.udiv, BinaryInstructions.idiv, BinaryInstructions.shr,
+               BinaryInstructions.sar, BinaryInstructions.imod, BinaryInstructions.umod):
+        for size in (1, 2, 4):
+            code = [mov(a, b, size=size), binary(op, a, c, a, size=size)]
+            assert peephole(code) == code
+
+
+def test_mov_binary_kept():
+    """The move is kept when the operation doesn't overwrite it or still reads it."""
+    # different sizes
+    code = [mov(a, b), binary(BinaryInstructions.add, a, c, a, size=4)]
+    assert peephole(code) == code
+
+    # result goes elsewhere, the move is still live
+    code = [mov(a, b), binary(BinaryInstructions.add, a, c, c)]
+    assert peephole(code) == code
+
+    # other operand reads the moved register through memory
+    code = [mov(a, b), binary(BinaryInstructions.add, a, Dereference(a, 8), a)]
+    assert peephole(code) == code
+
+    # the source of the move reads its destination
+    code = [mov(a, Dereference(a, 8)), binary(BinaryInstructions.add, a, c, a)]
+    assert peephole(code) == code
+
+    # jump target between the two
+    code = [mov(a, b), JumpTarget(), binary(BinaryInstructions.add, a, c, a)]
+    assert peephole(code) == code
@@ -0,0 +1,132 @@
+from wewcompiler.backend.rustvm.register_allocate import AllocationState, Load, Spill, allocate, coalesce_moves
+from wewcompiler.objects.ir_object import Binary, Immediate, MachineInstr, Mov, Push, Register
+
+
+def reg(n: int, size: int = 8) -> Register:
+    return Register(n, size)
+
+
+def assert_not_coalesced(code):
+    """Coalesce the code built by a function and check nothing changed."""
+    coalesced = code()
+    coalesce_moves(coalesced)
+    assert coalesced == code()
+    assert [str(i) for i in coalesced] == [str(i) for i in code()]
+
+
+def test_coalesce_move():
+    """A move from a register that dies into one that is born there is removed."""
+    code = [Mov(reg(0), Immediate(1, 8)),
+            Mov(reg(1), reg(0)),
+            Push(reg(1))]
+    coalesce_moves(code)
+    assert code == [Mov(reg(0), Immediate(1, 8)),
+                    Push(reg(0))]
+
+
+def test_coalesce_chain():
+    """A chain of moves collapses onto the first register."""
+    code = [Mov(reg(0), Immediate(1, 8)),
+            Mov(reg(1), reg(0)),
+            Mov(reg(2), reg(1)),
+            Mov(reg(3), reg(2)),
+            Binary.add(reg(3), Immediate(2, 8)),
+            Push(reg(3))]
+    coalesce_moves(code)
+    assert code == [Mov(reg(0), Immediate(1, 8)),
+                    Binary.add(reg(0), Immediate(2, 8)),
+                    Push(reg(0))]
+
+
+def test_coalesce_keeps_size():
+    """Renamed registers keep the size they were used at."""
+    code = [Mov(reg(0, 2), Immediate(1, 2)),
+            Mov(reg(1, 2), reg(0, 2)),
+            Push(reg(1, 2))]
+    coalesce_moves(code)
+    assert code[-1].arg.reg == 0
+    assert code[-1].arg.size == 2
+
+
+def test_no_coalesce_source_used_after():
+    """The move is kept if its source is still used afterwards."""
+    assert_not_coalesced(lambda: [Mov(reg(0), Immediate(1, 8)),
+                                  Mov(reg(1), reg(0)),
+                                  Binary.add(reg(1), reg(0)),
+                                  Push(reg(1))])
+
+
+def test_no_coalesce_dest_used_before():
+    """The move is kept if its destination already holds a value."""
+    assert_not_coalesced(lambda: [Mov(reg(1), Immediate(2, 8)),
+                                  Mov(reg(0), Immediate(1, 8)),
+                                  Mov(reg(1), reg(0)),
+                                  Push(reg(1))])
+
+
+def test_no_coalesce_sizes():
+    """Moves between registers of different sizes resize the value so are kept."""
+    assert_not_coalesced(lambda: [Mov(reg(0, 8), Immediate(1, 8)),
+                                  Mov(reg(1, 4), reg(0, 8)),
+                                  Push(reg(1, 4))])
+
+
+def test_no_coalesce_inline_asm():
+    """Registers used by inline asm are never renamed."""
+    assert_not_coalesced(lambda: [Mov(reg(0), Immediate(1, 8)),
+                                  Mov(reg(1), reg(0)),
+                                  MachineInstr("push", 8, [reg(1)])])
+
+    assert_not_coalesced(lambda: [MachineInstr("pop", 8, [reg(0)]),
+                                  Mov(reg(1), reg(0)),
+                                  Push(reg(1))])
+
+
+def test_next_use():
+    """The next use of a register is the first use at or after the current instruction."""
+    state = AllocationState(2)
+    state.register_uses = {0: [1, 4, 9]}
+
+    for position, expected in ((0, 1), (1, 1), (2, 4), (4, 4), (5, 9)):
+        state.position = position
+        assert state.next_use(reg(0)) == expected
+
+
+def test_spill_furthest_next_use():
+    """The register chosen to spill is the one used again furthest away."""
+    state = AllocationState(3)
+    state.register_uses = {0: [0, 8], 1: [0, 3], 2: [0, 5]}
+    # least recently used first: 1, 2, 0
+    for n in (1, 2, 0):
+        state.use_register(n, reg(n))
+    state.position = 1
+
+    assert state.least_active_register([]) == 0
+    assert state.least_active_register([0]) == 2
+
+
+def test_spill_ties_least_recently_used():
+    """Registers used again at the same point are spilled least recently used first."""
+    state = AllocationState(2)
+    state.register_uses = {0: [0, 5], 1: [0, 5]}
+    state.use_register(1, reg(1))
+    state.use_register(0, reg(0))
+    state.position = 1
+
+    assert state.least_active_register([]) == 1
+
+
+def test_allocate_spills_furthest_next_use():
+    """With every register taken the most recently used register is spilled if it is needed last."""
+    code = [Mov(reg(0), Immediate(1, 8)),
+            Mov(reg(1), Immediate(2, 8)),
+            Push(reg(0)),
+            Mov(reg(2), Immediate(3, 8)),  # %1 is used next, so %0 is spilled
+            Push(reg(1)),
+            Push(reg(2)),
+            Push(reg(0))]
+    allocate(2, code)
+
+    spilled_from = code[0].to.physical_register
+    assert code[3].pre_instructions == [Spill(spilled_from, 0)]
+    assert code[6].pre_instructions == [Load(code[6].arg.physical_register, 0)]
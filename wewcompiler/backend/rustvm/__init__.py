@@ -2,7 +2,7 @@ import sys
 import re
 import pprint
 from itertools import count
-from typing import Tuple, Dict, Any, Iterable
+from typing import Tuple, Dict, Any, Iterable, List
 
 import click
 import colorama
@@ -13,7 +13,9 @@ from tatsu.exceptions import FailedParse
 from wewcompiler.objects import base, parse_source, compile_source
 from wewcompiler.utils import add_line_count, strip_newlines
 from wewcompiler.objects.errors import CompileException
-from wewcompiler.backend.rustvm.assemble import process_code, assemble_instructions, group_fns_toplevel
+from wewcompiler.backend.rustvm.assemble import (process_code, assemble_instructions,
+                                                 iter_assembled, group_fns_toplevel)
+from wewcompiler.backend.rustvm.cache import CacheWriter, cache_key, load_cached
 
 
 def compile_and_pack(inp: str, reg_count: int = 10) -> Tuple[Dict[str, int], Any]:
@@ -21,20 +23,25 @@ def compile_and_pack(inp: str, reg_count: int = 10) -> Tuple[Dict[str, int], Any
     return process_code(compiler, reg_count), compiler
 
 
-def get_stats(compiler: base.Compiler, instructions: bytearray):
+def count_objects(compiler: base.Compiler) -> Tuple[int, int]:
+    """Count the functions and globals of a compiled program."""
     f, s = group_fns_toplevel(compiler.compiled_objects)
+    return len(f), len(s)
 
-    num_funs = len(f)
-    num_globals = len(s)
-    num_instructions = len(instructions)
 
+def get_stats(num_funs: int, num_globals: int, binary_length: int) -> List[str]:
     return [
         f"Function count: {num_funs}",
         f"Global count: {num_globals}",
-        f"Binary length: {num_instructions}"
+        f"Binary length: {binary_length}"
     ]
 
 
+def print_stats(stats: List[str]):
+    print("Stats: \n  ", end="")
+    print("\n  ".join(stats))
+
+
 @click.command()
 @click.argument("input", type=click.File('r'))
 @click.argument("out", type=click.File('wb'))
@@ -45,8 +52,9 @@ def get_stats(compiler: base.Compiler, instructions: bytearray):
 @click.option("--print-hwin", is_flag=True)
 @click.option("--print-offsets", is_flag=True)
 @click.option("--no-include-std", is_flag=True)
+@click.option("--no-cache", is_flag=True, help="Always recompile, ignoring and not updating the compile cache.")
 def compile(input, out, reg_count, show_stats, debug_compiler,
-            print_ir, print_hwin, print_offsets, no_include_std):
+            print_ir, print_hwin, print_offsets, no_include_std, no_cache):
 
     colorama.init(autoreset=True)
 
@@ -57,8 +65,28 @@ def compile(input, out, reg_count, show_stats, debug_compiler,
         print("No input", file=sys.stderr)
         exit(1)
 
+    # the IR and hardware instructions are not cached, so we need to compile to show them
+    use_cache = not (no_cache or print_ir or print_hwin)
+    key = None
+
+    if use_cache:
+        key = cache_key(input, reg_count, not no_include_std)
+        cached = load_cached(key)
+
+        if cached is not None:
+            offsets, counts, compiled = cached
+
+            if print_offsets:
+                pprint.pprint(offsets)
+
+            out.write(compiled)
+
+            if show_stats:
+                print_stats(get_stats(*counts, len(compiled)))
+            return
+
     try:
-        parsed = parse_source(input)
+        parsed = parse_source(input, cached=False)
     except FailedParse as e:
         print("Failed to parse input: ", file=sys.stderr)
 
@@ -104,7 +132,7 @@ def compile(input, out, reg_count, show_stats, debug_compiler,
         with open(stdlib_path) as f:
             stdlib = f.read()
 
-        parsed.extend(parse_source(stdlib))
+        parsed.extend(parse_source(stdlib, cached=False))
 
     compiler = base.Compiler()
 
@@ -128,13 +156,18 @@ def compile(input, out, reg_count, show_stats, debug_compiler,
     if print_offsets:
         pprint.pprint(offsets)
 
-    compiled = assemble_instructions(code)
+    counts = count_objects(compiler)
+    binary_length = 0
 
-    if show_stats:
-        print("Stats: \n  ", end="")
-        print("\n  ".join(get_stats(compiler, compiled)))
+    # the cache entry is written alongside the output, key is None when not caching
+    with CacheWriter(key, offsets, counts) as entry:
+        for chunk in iter_assembled(code):
+            out.write(chunk)
+            entry.write(chunk)
+            binary_length += len(chunk)
 
-    out.write(compiled)
+    if show_stats:
+        print_stats(get_stats(*counts, binary_length))
 
 
 if __name__ == '__main__':
@@ -1,59 +1,105 @@
+import struct
+from functools import lru_cache
 from itertools import chain
 from typing import Tuple, List, Dict, Union, Optional, Iterable, Any
 
 from wewcompiler.backend.rustvm.desugar import DesugarIR_Pre, DesugarIR_Post
 from wewcompiler.backend.rustvm import encoder
 from wewcompiler.backend.rustvm.register_allocate import allocate, Spill, Load
+from wewcompiler.backend.rustvm.peephole import peephole
 from wewcompiler.objects.base import FunctionDecl, StatementObject, Compiler, Scope
 from wewcompiler.objects.errors import InternalCompileException, CompileException
 from wewcompiler.objects.variable import Variable, DataReference
 from wewcompiler.objects import ir_object
+from wewcompiler.utils import partition
 
 
 def group_fns_toplevel(code: List[StatementObject]) -> Tuple[List[FunctionDecl],
                                                              List[StatementObject]]:
     """Groups toplevel declarations and functions seperately."""
-    fns, nfns = [], []
-
-    for i in code:
-        (fns if isinstance(i, FunctionDecl) else nfns).append(i)
-    return fns, nfns
+    return partition(lambda i: type(i) is FunctionDecl, code)
 
 
 def allocate_code(compiler: Compiler, reg_count) -> Tuple[List[FunctionDecl],
                                                           List[StatementObject]]:
-    """Allocates registers for toplevel and function level blocks."""
+    """Desugars and allocates registers for toplevel and function level blocks.
+
+    Each object is taken through pre-allocation desugaring, register allocation and
+    post-allocation desugaring in turn before moving onto the next object.
+
+    Also records the hardware registers each function uses so that they can be preserved.
+    """
 
     functions, toplevel = group_fns_toplevel(compiler.compiled_objects)
 
     toplevel_spill_vars = 0
 
     for i in toplevel:
+        DesugarIR_Pre.desugar(i)
         allocator = allocate(reg_count, i.code)
         toplevel_spill_vars = max(toplevel_spill_vars, len(allocator.spilled_registers))
+        DesugarIR_Post.desugar(i)
 
     compiler.add_spill_vars(toplevel_spill_vars)
 
     for i in functions:
-        allocator = allocate(reg_count, i.code)
-        i.add_spill_vars(len(allocator.spilled_registers))
+        DesugarIR_Pre.desugar(i)
+        allocate_function(i, reg_count)
+
+        # the prelude/ epilog need the size of the scope and the registers used,
+        # both of which are only known once the function has been allocated
+        DesugarIR_Post.desugar(i)
 
     return functions, toplevel
 
 
+def allocate_function(fn: FunctionDecl, reg_count: int):
+    """Allocates registers for a single function.
+
+    Only touches the function itself, so functions can be allocated independently.
+    """
+    allocator = allocate(reg_count, fn.code)
+    fn.add_spill_vars(len(allocator.spilled_registers))
+
+    # Preserve the registers used inside this function, the instructions to save/restore
+    # them are inserted when the prelude/ epilog of the function are desugared
+    fn.used_hw_regs = list(allocator.used_registers)
+
+
 def process_toplevel(compiler: Compiler, code: List[StatementObject]) -> List[ir_object.IRObject]:
     """Inserts scope around the toplevel assignment code."""
-    return [
-        ir_object.Binary.add(encoder.SpecificRegisters.stk, ir_object.Immediate(compiler.spill_size, 8)),
-        *chain.from_iterable(i.code for i in code),
-        ir_object.Binary.sub(encoder.SpecificRegisters.stk, ir_object.Immediate(compiler.spill_size, 8))
-    ]
+    toplevel = [ir_object.Binary.add(encoder.SpecificRegisters.stk, ir_object.cached_immediate(compiler.spill_size, 8))]
 
+    # extending by each object's code list lets the list grow by a known length each time
+    for i in code:
+        toplevel.extend(i.code)
+
+    toplevel.append(ir_object.Binary.sub(encoder.SpecificRegisters.stk, ir_object.cached_immediate(compiler.spill_size, 8)))
+    return toplevel
+
+
+#: little endian packers for immediates, keyed by size and whether the value is signed
+IMMEDIATE_PACKERS = {
+    (size, signed): struct.Struct("<" + (fmt.lower() if signed else fmt)).pack
+    for size, fmt in ((1, "B"), (2, "H"), (4, "I"), (8, "Q"))
+    for signed in (False, True)
+}
+
+
+def pack_immediate(val: int, size: int) -> bytes:
+    """Pack an immediate value into little endian bytes of a given size."""
+    packer = IMMEDIATE_PACKERS.get((size, val < 0))
+    if packer is None:
+        return val.to_bytes(length=size, byteorder="little", signed=val < 0)
+    return packer(val)
 
-def process_immediates(compiler: Compiler, code: List[StatementObject]):
+
+def process_immediates(compiler: Compiler, code: Iterable[ir_object.IRObject]):
     """Replaces immediate values that are too large to fit into 14 bits by allocating
     global objects for them and referencing them in the arguments."""
-    for i in chain.from_iterable(i.code for i in code):
+    Immediate = ir_object.Immediate
+
+    for i in code:
         for attr in i.touched_regs:
             arg = getattr(i, attr)
 
@@ -63,79 +109,142 @@ def process_immediates(compiler: Compiler, code: List[StatementObject]):
             #
             # HACK ALERT HACK ALERT
 
-            if not isinstance(arg, ir_object.Immediate):
+            if type(arg) is not Immediate:
                 continue
 
+            val = arg.val
+
             # if value more than 14 bits or negative
-            if arg.val > 0x3FFF or arg.val < 0:
+            if val > 0x3FFF or val < 0:
                 # bit length wont fit in an argument, we need to allocate a variable and make this point to it
-                signed = arg.val < 0
                 try:
-                    var = compiler.add_bytes(arg.val.to_bytes(length=arg.size, byteorder="little", signed=signed))
+                    var = compiler.add_bytes(pack_immediate(val, arg.size))
                     setattr(i, attr, ir_object.Dereference(var.global_offset, arg.size))
-                except OverflowError:
-                    raise InternalCompileException("Number: {arg.val} too large!")
+                except (OverflowError, struct.error):
+                    raise InternalCompileException(f"Number: {val} too large!")
+
 
+InstrOrTarget = Union[encoder.HardWareInstruction, ir_object.JumpTarget]
 
-def process_instruction(indexes: Dict[str, int],
-                        size: int,
-                        instr: Union[encoder.HardWareInstruction, ir_object.JumpTarget]) -> Optional[encoder.HardWareInstruction]:
-    """Process an instruction for packaging.
+#: A reference to a named location: the object holding it, the position in the object and the name referenced.
+Reference = Tuple[Any, int, str]
 
-    :returns: The instruction processed. Jump targets return None."""
-    if isinstance(instr, encoder.HardWareInstruction):
-        return instr
+#: Encoded code and the references held in its arguments.
+EncodedCode = Tuple[List[InstrOrTarget], List[Reference]]
 
-    elif isinstance(instr, ir_object.JumpTarget):
-        indexes[instr.identifier] = size
-        return None
+def dereference_name(arg: ir_object.Dereference) -> Optional[str]:
+    # we dont need to process dereferences of anything but data references
+    # as they can only be applied to registers or immediates
+    if type(arg.to) is DataReference:
+        return arg.to.name
+    return None
 
-    raise InternalCompileException("Content of code that was not a hardware instruction or jump point")
 
+#: Functions to get the name referenced by an instruction argument, keyed by the type of the argument.
+REFERENCE_NAMES = {
+    ir_object.DataReference: lambda arg: arg.name,
+    ir_object.Dereference: dereference_name,
+    ir_object.JumpTarget: lambda arg: arg.identifier
+}
 
-InstrOrTarget = Union[encoder.HardWareInstruction, ir_object.JumpTarget]
+#: Types of instruction arguments that can reference a named location.
+REFERENCE_TYPES = frozenset(REFERENCE_NAMES)
 
 
-def package_objects(compiler: Compiler,
-                    fns: List[Tuple[str, InstrOrTarget]],
-                    toplevel: List[InstrOrTarget]) -> Tuple[Dict[str, int], Any]:
-    """Packages objects into the binary, making multiple passes to resolve arguments
+def instruction_references(instr: encoder.HardWareInstruction) -> Iterable[Reference]:
+    """Find the arguments of a hardware instruction that reference a named location."""
+    for position, arg in enumerate(instr.args):
+        get_name = REFERENCE_NAMES.get(type(arg))
+        if get_name is None:
+            continue
 
-    All IR instructions should have been moved into HardWareInstructions by this point.
+        name = get_name(arg)
+        if name is not None:
+            yield instr, position, name
 
-    If no substitutions are made in a pass, the data will be scanned for any remaining references.
-    although remaining references should be minimal since the IR generator couldn't have worked
-    properly for everything but a missing main reference
 
-    :returns: The dict of identifier to byte offset and the packaged objects.
+def patch_reference(container: Any, position: int, location: encoder.HardwareMemoryLocation):
+    """Write the resolved location of a reference into the slot that held it."""
+    if not isinstance(container, encoder.HardWareInstruction):
+        container[position] = location
+        return
+
+    args = container.args
+    arg = args[position]
+
+    if isinstance(arg, ir_object.Dereference):
+        # dereferences of data are resolved to dereferences of the immediate address
+        arg.to = ir_object.Immediate(location.index, 2)
+    else:
+        container.args = (*args[:position], location, *args[position + 1:])
+
+
+def compute_layout(compiler: Compiler,
+                   fns: Iterable[Tuple[str, EncodedCode]],
+                   toplevel: EncodedCode) -> Tuple[Dict[str, int], List[Any], List[Reference]]:
+    """Place objects into the binary, computing the offset of every identifier.
+
+    Arguments are not touched, references are collected to be resolved once
+    the offsets of everything are known.
+
+    :returns: The dict of identifier to byte offset, the packaged objects and the references they hold.
     """
 
     packaged = []
     size = 0
-    indexes = {}  # CLEANUP: factor out state variables maybe?
+    indexes = {}
+    references = []
+
+    HardWareInstruction = encoder.HardWareInstruction
+    JumpTarget = ir_object.JumpTarget
+
+    def pack_code(code: List[InstrOrTarget], code_references: List[Reference]):
+        nonlocal size
+
+        append = packaged.append
+
+        # exact type checks, encoded code only ever holds these two types
+        for instr in code:
+            typ = type(instr)
+
+            if typ is HardWareInstruction:
+                size += instr.code_size
+                append(instr)
+
+            elif typ is JumpTarget:
+                indexes[instr.identifier] = size
+
+            else:
+                raise InternalCompileException("Content of code that was not a hardware instruction or jump point")
+
+        references.extend(code_references)
 
     starting_jump = encoder.HardWareInstruction(encoder.Manip.jmp, 2,
                                                 (ir_object.Immediate(1, 2),
                                                  ir_object.DataReference("toplevel-code")))
 
-    packaged.append(starting_jump)
-
-    size += starting_jump.code_size
+    pack_code([starting_jump], list(instruction_references(starting_jump)))
 
     indexes["program-data"] = size
 
+    data = compiler.data
+
     # do a single pass to place everything in the output table
-    for (ident, index) in compiler.data_identifiers.copy().items():
+    for (ident, index) in compiler.data_identifiers.items():
 
-        obj = compiler.data[index]
+        obj = data[index]
         indexes[ident] = size
 
-        if isinstance(obj, bytes):
+        if type(obj) is bytes:
             size += len(obj)
 
-        elif isinstance(obj, list):
+        elif type(obj) is list:
             size += len(obj) * 2  # Variables become pointers
 
+            references.extend((obj, position, elem.name)
+                              for position, elem in enumerate(obj)
+                              if isinstance(elem, Variable))
+
         packaged.append(obj)
 
     indexes["toplevel-code"] = size
@@ -145,60 +254,44 @@ def package_objects(compiler: Compiler,
     size += pre_instr.code_size
 
     # add in startup code
-    for i in toplevel:
-        instr = process_instruction(indexes, size, i)
-        if instr:
-            size += instr.code_size
-            packaged.append(instr)
+    pack_code(*toplevel)
 
-    # add in code
-    for (name, code) in fns:
+    # add in code, functions may be encoded lazily as they are placed
+    for (name, (code, code_references)) in fns:
         indexes[name] = size
-        for i in code:
-            instr = process_instruction(indexes, size, i)
-            if instr:
-                size += instr.code_size
-                packaged.append(instr)
+        pack_code(code, code_references)
 
     # set stack position
     pre_instr.args = (ir_object.Immediate(size + 2, 2),)
 
+    return indexes, packaged, references
+
+
+def resolve_references(indexes: Dict[str, int], references: List[Reference]):
+    """Substitute the offsets of the names referenced into the objects that reference them.
+
+    Any references to names that were never placed are unresolvable, although these should
+    be minimal since the IR generator couldn't have worked properly for everything but a
+    missing main reference.
+    """
+
     missing = []
 
-    for obj in packaged:
-        if isinstance(obj, encoder.HardWareInstruction):
-            args = list(obj.args)  # create list from args to allow us to mutate indexes
-            for position, arg in enumerate(args):
-                # resolve data reference
-                # we dont need to process dereferences as they can only be applied to registers or immediates
-                if isinstance(arg, ir_object.DataReference):
-                    if arg.name in indexes:  # replace reference to actual location
-                        args[position] = encoder.HardwareMemoryLocation(indexes[arg.name])
-                    else:
-                        missing.append(arg.name)
-
-                if isinstance(arg, ir_object.Dereference):
-                    if isinstance(arg.to, DataReference):
-                        if arg.to.name in indexes:
-                            arg.to = ir_object.Immediate(indexes[arg.to.name], 2)
-                        else:
-                            missing.append(arg.to.name)
-
-                # resolve jump target
-                if isinstance(arg, ir_object.JumpTarget):
-                    if arg.identifier in indexes:
-                        args[position] = encoder.HardwareMemoryLocation(indexes[arg.identifier])
-                    else:
-                        missing.append(arg.identifier)
-            obj.args = tuple(args)
-
-        if isinstance(obj, list):
-            for index, elem in enumerate(obj):
-                if isinstance(elem, Variable):
-                    if elem.name in indexes:
-                        obj[index] = encoder.HardwareMemoryLocation(indexes[elem.name])
-                    else:
-                        missing.append(elem.name)
+    # locations are immutable, so every reference to the same offset can share one
+    locations: Dict[int, encoder.HardwareMemoryLocation] = {}
+
+    for container, position, name in references:
+        offset = indexes.get(name)
+        if offset is None:
+            if name not in missing:
+                missing.append(name)
+            continue
+
+        location = locations.get(offset)
+        if location is None:
+            location = locations[offset] = encoder.HardwareMemoryLocation(offset)
+
+        patch_reference(container, position, location)
 
     if missing == ["main"]:
         # custom message when missing main
@@ -206,30 +299,28 @@ def package_objects(compiler: Compiler,
     if missing:
         raise InternalCompileException(f"Failed to resolve references: {missing}")
 
-    return indexes, packaged
 
+def package_objects(compiler: Compiler,
+                    fns: Iterable[Tuple[str, EncodedCode]],
+                    toplevel: EncodedCode) -> Tuple[Dict[str, int], Any]:
+    """Packages objects into the binary.
 
-def insert_register_stores(fn: FunctionDecl):
-    """Insert register stores to preserve registers used inside this function.
-
-    Inserts extra variables into the function body and inserts stores/ loads before and after the function code.
-    """
+    All IR instructions should have been moved into HardWareInstructions by this point.
 
-    # scan through the function and collect used registers
-    touched_regs = set()
+    Packaging happens in two passes, the first lays out every object to compute the offsets
+    of all identifiers, the second substitutes those offsets into the references recorded
+    during encoding and layout.
 
-    for i in fn.code:
-        touched_regs.update(
-            {reg.physical_register for reg in i.touched_registers}
-        )
+    :returns: The dict of identifier to byte offset and the packaged objects.
+    """
 
-    # Add vars here but dont actually insert instructions to save/restore
-    # instead this will happen when prelude/ epilog are desugared
+    indexes, packaged, references = compute_layout(compiler, fns, toplevel)
+    resolve_references(indexes, references)
 
-    fn.used_hw_regs = list(touched_regs)
+    return indexes, packaged
 
 
-def process_spill(scope: Scope, instr: Union[Spill, Load]) -> Iterable[encoder.HardWareInstruction]:
+def process_spill(scope: Union[Scope, Compiler], instr: Union[Spill, Load]) -> Iterable[encoder.HardWareInstruction]:
     """Process spill instructions."""
 
     # Spill:
@@ -241,35 +332,43 @@ def process_spill(scope: Scope, instr: Union[Spill, Load]) -> Iterable[encoder.H
     # load index of location to load
     # dereference into register
 
-    assert isinstance(instr, (Spill, Load))
+    is_spill = type(instr) is Spill
+    assert is_spill or type(instr) is Load
 
     reg_s8 = ir_object.AllocatedRegister(8, False, instr.reg)
     reg_s2 = ir_object.AllocatedRegister(2, False, instr.reg)
 
-    if isinstance(instr, Spill):
+    if is_spill:
         yield encoder.HardWareInstruction(
             encoder.Mem.push,
             8,
             (reg_s8,)
         )
 
-    yield encoder.HardWareInstruction(
-        encoder.Manip.mov,
-        2,
-        (reg_s2,
-         encoder.SpecificRegisters.bas)
-    )
+    var = scope.spill_vars[instr.index]
 
-    var = scope.lookup_variable(f"spill-var-{instr.index}")
-    assert var is not None
+    if var.stack_offset is not None:
+        yield encoder.HardWareInstruction(
+            encoder.Manip.mov,
+            2,
+            (reg_s2,
+             encoder.SpecificRegisters.bas)
+        )
 
-    yield encoder.HardWareInstruction(
-        encoder.BinaryInstructions.add,
-        2,
-        (reg_s2, ir_object.Immediate(var.stack_offset, 2), reg_s2)
-    )
+        yield encoder.HardWareInstruction(
+            encoder.BinaryInstructions.add,
+            2,
+            (reg_s2, ir_object.cached_immediate(var.stack_offset, 2), reg_s2)
+        )
+    else:
+        # toplevel code spills into global variables
+        yield encoder.HardWareInstruction(
+            encoder.Manip.mov,
+            2,
+            (reg_s2, var.global_offset)
+        )
 
-    if isinstance(instr, Spill):
+    if is_spill:
         yield encoder.HardWareInstruction(
             encoder.Mem.pop,
             8,
@@ -283,19 +382,38 @@ def process_spill(scope: Scope, instr: Union[Spill, Load]) -> Iterable[encoder.H
         )
 
 
-def encode_instructions(obj: Scope, instrs: List[ir_object.IRObject]) -> List[encoder.HardWareInstruction]:
+def encode_instructions(obj: Union[Scope, Compiler], instrs: List[ir_object.IRObject]) -> EncodedCode:
     """Encode a list of ir_object instructions into hardware instructions.
     This also pulls out loads and spills from instructions.
+
+    :returns: The encoded instructions and the references held in their arguments.
     """
 
-    encoded = []
+    encode_instr = encoder.InstructionEncoder.encode_instr
+
+    def encoded_stream():
+        for i in instrs:
+            for x in i.pre_instructions:
+                yield from process_spill(obj, x)
+            yield from encode_instr(i)
+
+    encoded = peephole(encoded_stream())
+    references = []
+    extend = references.extend
+
+    HardWareInstruction = encoder.HardWareInstruction
+
+    for instr in encoded:
+        # most instructions only take registers and immediates, skip scanning those
+        if type(instr) is HardWareInstruction and not REFERENCE_TYPES.isdisjoint(map(type, instr.args)):
+            extend(instruction_references(instr))
 
-    for i in instrs:
-        spills = chain.from_iterable(process_spill(obj, x) for x in i.pre_instructions)
-        encoded.extend(spills)
-        encoded.extend(encoder.InstructionEncoder.encode_instr(i))
+    return encoded, references
 
-    return encoded
+
+def encode_function(fn: FunctionDecl) -> Tuple[str, EncodedCode]:
+    """Encodes the code of a single function, independently of any other function."""
+    return fn.identifier, encode_instructions(fn, fn.code)
 
 
 def process_code(compiler: Compiler, reg_count) -> Tuple[Dict[str, int], Any]:
@@ -304,84 +422,95 @@ def process_code(compiler: Compiler, reg_count) -> Tuple[Dict[str, int], Any]:
     :returns: dictionary mapping identifiers to indexes, and the packaged objects in the order packed.
 
     Steps:
-      1. Desugar IR
-      2. Allocate registers
+      1. Desugar IR and allocate registers, one object at a time
+      2. Desugar the IR that depends on allocation
       3. Process Immediate values, optionally converting to globals
       4. Flatten data, instructions, insert setup instructions and main jump
       4. Resolve Jump targets, checking for main
       5. Package into :class:`encoder.HardwareInstruction` objects
       """
 
-    for o in compiler.compiled_objects:
-        DesugarIR_Pre.desugar(o)
-
     functions, toplevel = allocate_code(compiler, reg_count)
 
-    for fn in functions:
-        insert_register_stores(fn)
-
-    # NOTE: This mutates the objects contained in 'functions' and 'toplevel' on the line above
-    for o in compiler.compiled_objects:
-        DesugarIR_Post.desugar(o)
+    # the toplevel code is flattened once and the same list is used from here on
+    toplevel_instructions = process_toplevel(compiler, toplevel)
 
-    process_immediates(compiler, toplevel)
-    process_immediates(compiler, functions)
+    process_immediates(compiler, toplevel_instructions)
+    process_immediates(compiler, chain.from_iterable(i.code for i in functions))
 
-    toplevel_instructions = process_toplevel(compiler, toplevel)
+    encoded_toplevel, toplevel_references = encode_instructions(compiler, toplevel_instructions)
 
-    encoded_toplevel = encode_instructions(compiler, toplevel_instructions)
+    # functions are encoded as they are packaged, so only one function's encoded code is held at a time
+    encoded_functions = map(encode_function, functions)
 
-    encoded_functions = [(i.identifier, encode_instructions(i, i.code)) for i in functions]
+    call_main = encoder.HardWareInstruction(encoder.Mem.call, 2, (DataReference("main"),))
 
     encoded_toplevel.extend([
-        encoder.HardWareInstruction(encoder.Mem.call, 2, (DataReference("main"),)),
+        call_main,
         encoder.HardWareInstruction(encoder.Manip.halt, 1, ())
     ])
+    toplevel_references.extend(instruction_references(call_main))
 
-    return package_objects(compiler, encoded_functions, encoded_toplevel)
+    return package_objects(compiler, encoded_functions, (encoded_toplevel, toplevel_references))
 
 
-def assemble_single(obj: Any) -> bytes:
-    if isinstance(obj, bytes):
-        return obj
+@lru_cache(maxsize=None)
+def register_param(physical_register: int, deref: bool) -> bytes:
+    """Packed parameter for an allocated register, there are only a handful of these so they are cached."""
+    return encoder.pack_param(physical_register + encoder.SpecificRegisters.free_reg_offset, deref=deref, reg=True)
 
-    if isinstance(obj, list):
-        return b"".join(map(assemble_single, obj))
 
-    if isinstance(obj, encoder.HardwareMemoryLocation):
-        return encoder.pack_param(obj.index)
+def assemble_register(reg: Union[ir_object.Register, ir_object.AllocatedRegister], deref: bool = False) -> bytes:
+    return register_param(reg.physical_register, deref)
 
-    if isinstance(obj, ir_object.Dereference):
-        if isinstance(obj.to, ir_object.Immediate):
-            return encoder.pack_param(obj.to.val, deref=True)
 
-        if isinstance(obj.to, (ir_object.Register, ir_object.AllocatedRegister)):
-            return encoder.pack_param(obj.to.physical_register + encoder.SpecificRegisters.free_reg_offset, deref=True, reg=True)
+def assemble_dereference(obj: ir_object.Dereference) -> bytes:
+    if isinstance(obj.to, ir_object.Immediate):
+        return encoder.pack_param(obj.to.val, deref=True)
 
-    if isinstance(obj, ir_object.Immediate):
-        return encoder.pack_param(obj.val)
+    if isinstance(obj.to, (ir_object.Register, ir_object.AllocatedRegister)):
+        return assemble_register(obj.to, deref=True)
 
-    if isinstance(obj, (ir_object.Register, ir_object.AllocatedRegister)):
-        return encoder.pack_param(obj.physical_register + encoder.SpecificRegisters.free_reg_offset, reg=True)
+    raise InternalCompileException(f"Could not assemble dereference of: {obj.to} of type: {type(obj.to)}")
 
-    if isinstance(obj, encoder.HardwareRegister):
-        return encoder.pack_param(obj.index, reg=True)
 
+#: assemblers for packaged objects and instruction arguments, keyed by the exact type of the object
+_ASSEMBLERS = {
+    bytes: lambda obj: obj,
+    list: lambda obj: b"".join(map(assemble_single, obj)),
+    encoder.HardwareMemoryLocation: lambda obj: encoder.pack_param(obj.index),
+    ir_object.Dereference: assemble_dereference,
+    ir_object.Immediate: lambda obj: encoder.pack_param(obj.val),
+    ir_object.Register: assemble_register,
+    ir_object.AllocatedRegister: assemble_register,
+    encoder.HardwareRegister: lambda obj: encoder.pack_param(obj.index, reg=True),
+    int: encoder.pack_param
+}
+
+
+def assemble_single(obj: Any) -> bytes:
+    assembler = _ASSEMBLERS.get(type(obj))
+    if assembler is not None:
+        return assembler(obj)
+
+    # enum arguments such as comparison types are int subclasses
     if isinstance(obj, int):
         return encoder.pack_param(obj)
 
     raise InternalCompileException(f"Could not assemble object: {obj} of type: {type(obj)}")
 
 
-def assemble_instructions(packed_instructions: List[Any]) -> bytearray:
-    assembled = bytearray()
+def iter_assembled(packed_instructions: Iterable[Any]) -> Iterable[bytes]:
+    """Assemble packaged objects, yielding the bytes of each object in turn."""
+    HardWareInstruction = encoder.HardWareInstruction
+    pack_instruction = encoder.pack_instruction
 
     for i in packed_instructions:
-        if isinstance(i, encoder.HardWareInstruction):
-            assembled.extend(encoder.pack_instruction(i))
-            for arg in i.args:
-                assembled.extend(assemble_single(arg))
+        if type(i) is HardWareInstruction:
+            yield pack_instruction(i) + b"".join(map(assemble_single, i.args))
         else:
-            assembled.extend(assemble_single(i))
+            yield assemble_single(i)
+
 
-    return assembled
+def assemble_instructions(packed_instructions: Iterable[Any]) -> bytes:
+    return b"".join(iter_assembled(packed_instructions))
@@ -0,0 +1,133 @@
+"""On-disk cache of assembled binaries, keyed by a hash of the compiler inputs."""
+
+import os
+import pickle
+import hashlib
+from functools import lru_cache
+from typing import Tuple, Dict, Optional
+
+import wewcompiler
+
+#: bumped whenever the layout of a cache entry changes
+CACHE_FORMAT = 3
+
+#: offsets, function and global counts, and the binary
+CacheEntry = Tuple[Dict[str, int], Tuple[int, int], bytes]
+
+
+def cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "a-compiler")
+
+
+@lru_cache(maxsize=None)
+def compiler_fingerprint() -> str:
+    """Hash the source of the compiler package itself.
+
+    Any change to the compiler (or the bundled stdlib) changes the fingerprint
+    and so invalidates every existing cache entry.
+    """
+    root = os.path.dirname(wewcompiler.__file__)
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d != "__pycache__")
+        for name in sorted(filenames):
+            if not name.endswith((".py", ".ebnf", ".wew")):
+                continue
+            path = os.path.join(dirpath, name)
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def cache_key(source: str, reg_count: int, include_std: bool) -> str:
+    digest = hashlib.sha256()
+    digest.update(compiler_fingerprint().encode())
+    digest.update(f"{reg_count}:{include_std}:".encode())
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+def cache_path(key: str) -> str:
+    return os.path.join(cache_dir(), f"{key}.bin")
+
+
+def load_cached(key: str) -> Optional[CacheEntry]:
+    """Load a cached (offsets, counts, binary) entry, returns None on a miss or a stale entry.
+
+    An entry is the format byte, a pickled (offsets, counts) header then the raw binary.
+    """
+    try:
+        with open(cache_path(key), "rb") as f:
+            if f.read(1) != bytes((CACHE_FORMAT,)):
+                return None
+            try:
+                offsets, counts = pickle.load(f)
+            except Exception:
+                return None
+            return offsets, counts, f.read()
+    except OSError:
+        return None
+
+
+class CacheWriter:
+    """Writes a cache entry as the binary is produced.
+
+    The entry is written to a temporary file which only replaces the cached entry once
+    the binary is complete. Failing to write is silent and drops the entry, as does a key of None.
+    """
+
+    def __init__(self, key: Optional[str], offsets: Dict[str, int], counts: Tuple[int, int]):
+        self.file = None
+        if key is None:
+            return
+
+        self.path = cache_path(key)
+        self.tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.tmp_path, "wb")
+            self.file.write(bytes((CACHE_FORMAT,)))
+            pickle.dump((offsets, counts), self.file)
+        except OSError:
+            self.abort()
+
+    def write(self, data: bytes):
+        if self.file is None:
+            return
+        try:
+            self.file.write(data)
+        except OSError:
+            self.abort()
+
+    def commit(self):
+        """Finish the entry, replacing any existing entry for the key."""
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError:
+            self.abort()
+        self.file = None
+
+    def abort(self):
+        """Drop the entry, removing the temporary file."""
+        if self.file is None:
+            return
+        self.file.close()
+        self.file = None
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
@@ -1,8 +1,6 @@
-from itertools import chain
-from typing import Iterable
-
 from wewcompiler.backend.rustvm import encoder
 from wewcompiler.objects import ir_object
+from wewcompiler.objects.ir_object import cached_immediate
 from wewcompiler.objects.variable import DataReference
 from wewcompiler.objects.base import StatementObject, CompileContext
 from wewcompiler.objects.errors import InternalCompileException
@@ -18,28 +16,30 @@ class Desugarer(Emitter):
     @classmethod
     def desugar(cls, obj: StatementObject):
         """Desugars code for an object in place."""
-        obj.context.code[:] = chain.from_iterable(
-            cls.method_for(ir)(obj.context, ir)
-            for ir in obj.context.code
-        )
+        ctx = obj.context
+        emitters = cls.emitters
+
+        desugared = []
+        append = desugared.append
+        extend = desugared.extend
+
+        for ir in ctx.code:
+            emitter = emitters.get(type(ir))
+            if emitter is None:
+                append(ir)
+            else:
+                extend(emitter(ctx, ir))
+
+        ctx.code[:] = desugared
 
 
 class DesugarIR_Post(Desugarer):
     """Desugarer for the IR, Performed post-allocation."""
 
-    @classmethod
-    def desugar_instr(cls, ctx: CompileContext, instr: ir_object.IRObject) -> Iterable[ir_object.IRObject]:
-        """Desugars an ir object"""
-        name = type(instr).__name__
-        if name in cls.emitters:
-            yield from cls.emitters[name](ctx, instr)
-        else:
-            yield instr
-
     @emits(ir_object.Prelude)
     def emit_prelude(cls, ctx: CompileContext, pre: ir_object.Prelude):  # pylint: disable=unused-argument
         # vm enters function with base pointer and stack pointer equal
-        yield ir_object.Binary.add(encoder.SpecificRegisters.stk, ir_object.Immediate(pre.scope.size, 8))
+        yield ir_object.Binary.add(encoder.SpecificRegisters.stk, cached_immediate(pre.scope.size, 8))
         for reg in pre.scope.used_hw_regs:
             yield ir_object.Push(ir_object.AllocatedRegister(8, False, reg))
 
@@ -47,7 +47,7 @@ class DesugarIR_Post(Desugarer):
     def emit_epilog(cls, ctx: CompileContext, epi: ir_object.Epilog):  # pylint: disable=unused-argument
         for reg in reversed(epi.scope.used_hw_regs):
             yield ir_object.Pop(ir_object.AllocatedRegister(8, False, reg))
-        yield ir_object.Binary.sub(encoder.SpecificRegisters.stk, ir_object.Immediate(epi.scope.size, 8))
+        yield ir_object.Binary.sub(encoder.SpecificRegisters.stk, cached_immediate(epi.scope.size, 8))
 
 
 class DesugarIR_Pre(Desugarer):
@@ -1,8 +1,9 @@
 from typing import Union, Tuple, Iterable
 from enum import IntEnum
+from struct import Struct
 from dataclasses import dataclass
 
-from wewcompiler.objects.ir_object import Register, Dereference, DataReference, JumpTarget
+from wewcompiler.objects.ir_object import Register, Dereference, DataReference, JumpTarget, cached_immediate
 from wewcompiler.objects.errors import InternalCompileException
 from wewcompiler.objects import ir_object
 from wewcompiler.utils.emitterclass import Emitter, emits
@@ -18,6 +19,14 @@ class BinaryInstructions(IntEnum):
         return 0
 
 
+#: binary instructions by the name of the operation in the IR, 'and' and 'or' are keywords so are renamed
+BINARY_OPS = {
+    **BinaryInstructions.__members__,
+    "and": BinaryInstructions.and_,
+    "or": BinaryInstructions.or_
+}
+
+
 class UnaryInstructions(IntEnum):
     """Unary instructions."""
     (binv, linv, neg, pos) = range(4)
@@ -27,6 +36,10 @@ class UnaryInstructions(IntEnum):
         return 1
 
 
+#: unary instructions by the name of the operation in the IR
+UNARY_OPS = dict(UnaryInstructions.__members__)
+
+
 class Manip(IntEnum):
     """Cpu manipulation instructions."""
     (mov, sxu, sxi, jmp, set, tst, halt) = range(7)
@@ -54,6 +67,14 @@ class IO(IntEnum):
         return 4
 
 
+#: every hardware instruction by name, used to look up instructions written in inline asm
+MACHINE_INSTRS = {
+    name: op
+    for group in (BinaryInstructions, UnaryInstructions, Manip, Mem, IO)
+    for name, op in group.__members__.items()
+}
+
+
 # Why have this? because we need to distinguish from allocated free-use registers
 # and other registers (stack pointer, base pointer, current-instruction pointer, etc)
 
@@ -84,7 +105,7 @@ class SpecificRegisters:
 @dataclass
 class HardWareInstruction:
 
-    __slots__ = ("instr", "size", "args")
+    __slots__ = ("instr", "size", "args", "code_size")
 
     instr: Union[BinaryInstructions,
                  UnaryInstructions,
@@ -98,30 +119,47 @@ class HardWareInstruction:
                       HardwareMemoryLocation,
                       JumpTarget]]
 
-    @property
-    def code_size(self):
-        return 2 * (1 + len(self.args))
+    def __post_init__(self):
+        # arguments are only ever substituted in place, so the encoded size is fixed
+        self.code_size = 2 * (1 + len(self.args))
+
+
+#: encoding of operation sizes in the top two bits of an instruction
+SIZE_CODES = {
+    1: 0,
+    2: 1,
+    4: 2,
+    8: 3
+}
+
+pack_u16 = Struct("<H").pack
+pack_i16 = Struct("<h").pack
+
+
+#: packed instruction words, keyed by instruction group then by opcode and size
+INSTRUCTION_WORDS = {
+    group: {
+        (op, size): pack_u16((code << 14) | (op.group << 8) | op)
+        for op in group
+        for size, code in SIZE_CODES.items()
+    }
+    for group in (BinaryInstructions, UnaryInstructions, Manip, Mem, IO)
+}
 
 
 def pack_instruction(instr: HardWareInstruction) -> bytes:
     """Pack an instruction into bytes."""
     idx = instr.instr
 
-    size = {
-        1: 0,
-        2: 1,
-        4: 2,
-        8: 3
-    }[instr.size]
-
-    value = (size << 14) | (idx.group << 8) | idx
-    return (value & 0xffff).to_bytes(2, byteorder="little")
+    # the instruction enums compare equal by value, so the words are looked up by group first
+    return INSTRUCTION_WORDS[type(idx)][idx, instr.size]
 
 
 def pack_param(param: int, reg: bool = False, deref: bool = False) -> bytes:
     """Packs a single parameter into bytes."""
-    signed = param < 0
-    return (param | reg << 15 | deref << 14).to_bytes(2, byteorder="little", signed=signed)
+    if param < 0:
+        return pack_i16(param | reg << 15 | deref << 14)
+    return pack_u16(param | reg << 15 | deref << 14)
 
 
 class InstructionEncoder(Emitter):
@@ -136,7 +174,10 @@ class InstructionEncoder(Emitter):
         """Encode an IR Instruction into a hardware instruction.
         Some instructions may expand into multiple hardware instructions so the result is an iterable.
         """
-        yield from cls.method_for(instr)(instr)
+        method = cls.emitters.get(type(instr))
+        if method is None:
+            return cls.default(instr)
+        return method(instr)
 
     @emits(ir_object.JumpTarget)
     def emit_jumptarget(cls, instr: ir_object.JumpTarget):
@@ -153,7 +194,7 @@ class InstructionEncoder(Emitter):
     @emits(ir_object.Unary)
     def emit_unary(cls, instr: ir_object.Unary):
 
-        hwin = getattr(UnaryInstructions, instr.op)
+        hwin = UNARY_OPS[instr.op]
 
         yield HardWareInstruction(
             hwin,
@@ -164,15 +205,7 @@ class InstructionEncoder(Emitter):
     @emits(ir_object.Binary)
     def emit_binary(cls, instr: ir_object.Binary):
 
-        replacements = {
-            "and": "and_",
-            "or": "or_"
-        }
-
-        # replace 'and' with 'and_', etc. leave everything else
-        op = replacements.get(instr.op) or instr.op
-
-        hwin = getattr(BinaryInstructions, op)
+        hwin = BINARY_OPS[instr.op]
 
         yield HardWareInstruction(
             hwin,
@@ -231,7 +264,7 @@ class InstructionEncoder(Emitter):
         yield HardWareInstruction(
             BinaryInstructions.sub,
             8,
-            (SpecificRegisters.stk, ir_object.Immediate(instr.scope.size, 8), SpecificRegisters.stk)
+            (SpecificRegisters.stk, cached_immediate(instr.scope.size, 8), SpecificRegisters.stk)
         )
 
         yield HardWareInstruction(
@@ -249,7 +282,7 @@ class InstructionEncoder(Emitter):
             (instr.jump,)
         )
 
-        arg_len = ir_object.Immediate(instr.argsize, 8)
+        arg_len = cached_immediate(instr.argsize, 8)
 
         # move up the stack pointer to clear off the arguments
 
@@ -267,7 +300,7 @@ class InstructionEncoder(Emitter):
 
     @emits(ir_object.Jump)
     def emit_jump(cls, instr: ir_object.Jump):
-        condition = instr.condition or ir_object.Immediate(1, 2)  # 2-byte containing 1
+        condition = instr.condition or cached_immediate(1, 2)  # 2-byte containing 1
 
         yield HardWareInstruction(
             Manip.jmp,
@@ -284,12 +317,7 @@ class InstructionEncoder(Emitter):
         # instruction size is size of 'from_' param
         # instruction size parameter is size of 'to' param
 
-        size = {
-            1: 0,
-            2: 1,
-            4: 2,
-            8: 3
-        }[instr.to.size]
+        size = SIZE_CODES[instr.to.size]
 
         yield HardWareInstruction(
             hwin,
@@ -300,11 +328,8 @@ class InstructionEncoder(Emitter):
     @emits(ir_object.MachineInstr)
     def emit_machine_instr(cls, instr: ir_object.MachineInstr):
 
-        for group in (BinaryInstructions, UnaryInstructions, Manip, Mem, IO):
-            hwin = getattr(group, instr.instr, None)
-            if hwin is not None:
-                break
-        else:
+        hwin = MACHINE_INSTRS.get(instr.instr)
+        if hwin is None:
             raise InternalCompileException(f"Could not find instruction by name: {instr.instr}")
 
         yield HardWareInstruction(
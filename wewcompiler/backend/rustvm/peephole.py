@@ -0,0 +1,204 @@
+"""Peephole optimisation of encoded hardware instructions.
+
+Rules only ever look at instructions that are directly adjacent in the stream,
+any jump target between two instructions breaks the window so nothing is removed
+from across a point that can be jumped to.
+
+Inline asm can produce instructions with any number of operands,
+rules leave alone any instruction without the operand count they expect.
+"""
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from wewcompiler.backend.rustvm import encoder
+from wewcompiler.backend.rustvm.encoder import BinaryInstructions, HardWareInstruction, Manip, Mem
+from wewcompiler.objects import ir_object
+
+
+def register_index(arg: Any) -> Optional[int]:
+    """Get the hardware register index of an argument, if it is a plain register."""
+    if isinstance(arg, (ir_object.Register, ir_object.AllocatedRegister)):
+        return arg.physical_register + encoder.SpecificRegisters.free_reg_offset
+    if isinstance(arg, encoder.HardwareRegister):
+        return arg.index
+    return None
+
+
+def reads_register(arg: Any, index: int) -> bool:
+    """Does an argument read a hardware register, either directly or through a dereference."""
+    if isinstance(arg, ir_object.Dereference):
+        arg = arg.to
+    return register_index(arg) == index
+
+
+def same_location(a: Any, b: Any) -> bool:
+    """Do two arguments refer to the same register or memory location."""
+    if isinstance(a, ir_object.Dereference) and isinstance(b, ir_object.Dereference):
+        if a.size != b.size:
+            return False
+        a, b = a.to, b.to
+        if type(a) is ir_object.Immediate and type(b) is ir_object.Immediate:
+            return a.val == b.val
+
+    index = register_index(a)
+    return index is not None and index == register_index(b)
+
+
+def signature(instr: HardWareInstruction) -> Tuple[type, int]:
+    # the instruction enums compare equal to each other by value, include the type to keep them apart
+    return type(instr.instr), instr.instr
+
+
+def is_redundant(instr: HardWareInstruction) -> bool:
+    """Is an instruction a no-op by itself.
+
+    Register writes are masked to the size of the operation so only 8 byte operations are dropped.
+    """
+    if instr.size != 8:
+        return False
+    if (type(instr.instr) is BinaryInstructions and instr.instr in (BinaryInstructions.add, BinaryInstructions.sub)
+            and len(instr.args) == 3):
+        left, right, dest = instr.args
+        return (type(right) is ir_object.Immediate and right.val == 0
+                and register_index(left) is not None
+                and register_index(left) == register_index(dest))
+    if instr.instr is Manip.mov and len(instr.args) == 2:
+        to, from_ = instr.args
+        return register_index(to) is not None and register_index(to) == register_index(from_)
+    return False
+
+
+Rewrite = Optional[Sequence[HardWareInstruction]]
+
+
+def mov_mov(first: HardWareInstruction, second: HardWareInstruction) -> Rewrite:
+    """Rewrite two adjacent moves.
+
+    mov a, b; mov a, c  ->  mov a, c       (when c does not read a)
+    mov a, b; mov b, a  ->  mov a, b       (when the second move cannot truncate b)
+    """
+    if len(first.args) != 2 or len(second.args) != 2:
+        return None
+
+    (first_to, first_from), (second_to, second_from) = first.args, second.args
+    dest = register_index(first_to)
+
+    if dest is None:
+        return None
+
+    # first move is overwritten before it is read
+    if register_index(second_to) == dest and not reads_register(second_from, dest):
+        return (second,)
+
+    # second move writes back the value that was just moved
+    if (register_index(second_from) == dest
+            and second.size == first.size
+            and same_location(second_to, first_from)
+            and not reads_register(first_from, dest)
+            and (first.size == 8 or isinstance(first_from, ir_object.Dereference))):
+        return (first,)
+
+    return None
+
+
+def push_pop(first: HardWareInstruction, second: HardWareInstruction) -> Rewrite:
+    """Remove a push immediately popped back into the same register.
+
+    push a; pop a  ->
+    """
+    if len(first.args) != 1 or len(second.args) != 1:
+        return None
+
+    (pushed,), (popped,) = first.args, second.args
+    index = register_index(pushed)
+
+    if first.size == second.size == 8 and index is not None and register_index(popped) == index:
+        return ()
+
+    return None
+
+
+#: operations where the low bytes of the result only depend on the low bytes of the operands
+LOW_BYTE_OPS = frozenset((BinaryInstructions.add, BinaryInstructions.sub, BinaryInstructions.mul,
+                          BinaryInstructions.and_, BinaryInstructions.or_, BinaryInstructions.xor))
+
+#: operations where the low bytes of the result only depend on the low bytes of the left operand
+LOW_BYTE_LEFT_OPS = frozenset((BinaryInstructions.shl,))
+
+
+def mov_binary(first: HardWareInstruction, second: HardWareInstruction) -> Rewrite:
+    """Fold a move into the operation that overwrites its destination.
+
+    mov a, b; op a, c -> a  ->  op b, c -> a      (when c does not read a)
+    mov a, b; op c, a -> a  ->  op c, b -> a      (when c does not read a)
+
+    A move below 8 bytes truncates, so smaller operations are only folded when the truncated bytes
+    can't change the result: a shift count is read at full width so only a shifted value is folded.
+    """
+    if len(first.args) != 2 or len(second.args) != 3:
+        return None
+
+    to, from_ = first.args
+    left, right, dest = second.args
+    index = register_index(to)
+
+    if (index is None or register_index(dest) != index or first.size != second.size
+            or reads_register(from_, index)):
+        return None
+
+    if first.size != 8:
+        if second.instr in LOW_BYTE_LEFT_OPS:
+            if register_index(right) == index:
+                return None
+        elif second.instr not in LOW_BYTE_OPS:
+            return None
+
+    args = []
+    for arg in (left, right):
+        if register_index(arg) == index:
+            args.append(from_)
+        elif reads_register(arg, index):
+            return None
+        else:
+            args.append(arg)
+
+    return (HardWareInstruction(second.instr, second.size, (*args, dest)),)
+
+
+#: rewrites for pairs of adjacent instructions, keyed by the signatures of both instructions
+PAIR_RULES: Dict[Tuple[Tuple[type, int], Tuple[type, int]],
+                 Callable[[HardWareInstruction, HardWareInstruction], Rewrite]] = {
+    ((Manip, Manip.mov), (Manip, Manip.mov)): mov_mov,
+    ((Mem, Mem.push), (Mem, Mem.pop)): push_pop,
+    **{((Manip, Manip.mov), (BinaryInstructions, op)): mov_binary for op in BinaryInstructions},
+}
+
+
+def peephole(code: Iterable[Any]) -> List[Any]:
+    """Run peephole rules over a stream of encoded instructions and jump targets."""
+    optimised: List[Any] = []
+    append = optimised.append
+
+    for instr in code:
+        if type(instr) is not HardWareInstruction:
+            append(instr)
+            continue
+
+        if is_redundant(instr):
+            continue
+
+        if optimised and type(optimised[-1]) is HardWareInstruction:
+            previous = optimised[-1]
+            rule = PAIR_RULES.get((signature(previous), signature(instr)))
+
+            if rule is not None:
+                rewritten = rule(previous, instr)
+
+                if rewritten is not None:
+                    optimised.pop()
+                    optimised.extend(rewritten)
+                    continue
+
+        append(instr)
+
+    return optimised
@@ -1,10 +1,12 @@
-from enum import Enum, auto
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from collections import OrderedDict
+from bisect import bisect_left
+from heapq import heappop, heappush
+from typing import Any, Dict, List, Optional, Sequence, Set
 from dataclasses import dataclass
 
 from wewcompiler.objects import ir_object
 from wewcompiler.objects.errors import InternalCompileException
-from wewcompiler.objects.ir_object import Register
+from wewcompiler.objects.ir_object import Dereference, MachineInstr, Mov, Register
 
 
 @dataclass
@@ -44,6 +46,8 @@ class Spill:
     :index: Index of saved registers to save to
     """
 
+    __slots__ = ("reg", "index")
+
     reg: int
     index: int
 
@@ -56,52 +60,66 @@ class Load:
     :index: Index of saved registers to load from
     """
 
+    __slots__ = ("reg", "index")
+
     reg: int
     index: int
 
 
-class RegisterState(Enum):
-    """The state of a virtual register."""
-
-    #: allocated to a real register
-    Allocated = auto()
+class AllocationState:
+    def __init__(self, reg_count: int):
+        self.reg_count = reg_count
 
-    #: register is now inactive
-    Empty = auto()
+        #: every real register available to the allocator
+        self.all_registers = frozenset(range(reg_count))
+        self.usable_registers = set(self.all_registers)
 
-    #: register is saved to memory
-    Spilled = auto()
+        # the state of a virtual register is which of these it is in, they are keyed by register number
 
+        #: virtual registers allocated to a real register, k:v of virtual register to real register
+        self.allocated_virtuals: Dict[int, int] = {}
 
-class AllocationState:
-    def __init__(self, reg_count: int):
-        self.reg_count = reg_count
-        self.usable_registers = set(range(reg_count))
+        #: virtual registers saved to memory, k:v of virtual register to spill slot
+        self.spilled_virtuals: Dict[int, int] = {}
 
-        #: the states of virtual registers, dict of Registers to Tuples of state and data
-        self.register_states: Dict[Register, Tuple[RegisterState, Any]] = {}
+        #: virtual registers that are now inactive
+        self.dead_virtuals: Set[int] = set()
 
         #: list of extra memory places that are used to hold spilled registers
-        # We use a list for this so that we can check if it's full
-        # (No None's) and to grow we just append a None
+        # To grow we just append a None, freed slots are tracked in free_spill_slots
         self.spilled_registers: List[Optional[Register]] = []
 
-        #: the stack of allocated registers, k:v of real register to virtual register
-        self.allocated_registers: Dict[int, Register] = {}
+        #: heap of the indexes of empty slots in spilled_registers
+        self.free_spill_slots: List[int] = []
+
+        #: the allocated registers, k:v of real register to virtual register
+        # ordered from least to most recently used
+        self.allocated_registers: Dict[int, Register] = OrderedDict()
+
+        #: every real register that has been handed out during allocation
+        self.used_registers: Set[int] = set()
+
+        #: the indexes of the instructions that use each virtual register, keyed by register number
+        self.register_uses: Dict[int, List[int]] = {}
+
+        #: index of the instruction currently being allocated
+        self.position = 0
 
     def emit_spill(self, v_reg: Register, reg: int):
         """Emit a spill for a register.
         :returns: The IR instruction to spill."""
 
-        # There's an empty spill location, spill to that
-        if None in self.spilled_registers:
-            index = self.spilled_registers.index(None)
-        # All slots to spill to are free, create a new one
+        # There's an empty spill location, spill to that. Slots are freed as soon as the register
+        # is loaded back or dies, so the number of slots is the most spilled at any one time
+        if self.free_spill_slots:
+            index = heappop(self.free_spill_slots)
+        # All slots to spill to are taken, create a new one
         else:
             index = len(self.spilled_registers)
             self.spilled_registers.append(None)
         self.spilled_registers[index] = v_reg
-        self.register_states[v_reg] = (RegisterState.Spilled, index)
+        del self.allocated_virtuals[v_reg.reg]
+        self.spilled_virtuals[v_reg.reg] = index
         return Spill(reg, index)
 
     def emit_load(self, v_reg: Register, reg: int):
@@ -109,115 +127,217 @@ class AllocationState:
         :returns: The IR instruction to load."""
 
         # find where this register was spilled to
-        index = self.spilled_registers.index(v_reg)
+        index = self.spilled_virtuals.pop(v_reg.reg)
 
         # mark the spill slot as free
         self.spilled_registers[index] = None
-        self.register_states[v_reg] = (RegisterState.Allocated, reg)
+        heappush(self.free_spill_slots, index)
+        self.allocated_virtuals[v_reg.reg] = reg
         return Load(reg, index)
 
     def free_register(self, v_reg: Register):
         """Mark a virtual register as unused,
         any further attempts to access it will raise an Exception"""
 
-        # get this register's current state. Because of the structure of the algorithm it's
-        # unlikely to be anything but an Allocated state.
-        state, data = self.register_states[v_reg]
-        self.register_states[v_reg] = (RegisterState.Empty, None)
+        # Because of the structure of the algorithm it's unlikely to be anything but allocated.
+        reg = self.allocated_virtuals.pop(v_reg.reg, None)
 
         # If allocated, delete it from the allocation table and mark it as used
-        if state is RegisterState.Allocated:
-            del self.allocated_registers[data]
-            self.usable_registers.add(data)
+        if reg is not None:
+            del self.allocated_registers[reg]
+            self.usable_registers.add(reg)
         # if spilled, remove it from the array of spilled registers
-        elif state is RegisterState.Spilled:
-            index = self.spilled_registers.index(v_reg)
+        elif v_reg.reg in self.spilled_virtuals:
+            index = self.spilled_virtuals.pop(v_reg.reg)
             self.spilled_registers[index] = None
+            heappush(self.free_spill_slots, index)
         else:
             raise InternalCompileException("Tried to free a dead register")
 
+        self.dead_virtuals.add(v_reg.reg)
+
+    def next_use(self, v_reg: Register) -> int:
+        """Get the index of the next instruction that uses a virtual register."""
+        uses = self.register_uses[v_reg.reg]
+        return uses[bisect_left(uses, self.position)]
+
     def least_active_register(self, exclude: List[int]):
-        """Return the current least active register.
+        """Return the current least active register,
+        this is the register that will not be used again for the longest time.
 
         :param exclude: List of registers to not consider inactive at all."""
-        # TODO: a better algorithm
-        # currently this just gets a random (by chance of program state)
-        # register from the active pool
-        return (set(range(self.reg_count))
-                .difference(exclude)
-                .difference(self.usable_registers)
-                .pop())
+        # max returns the first of equal candidates, which is the least recently used
+        return max((reg for reg in self.allocated_registers if reg not in exclude),
+                   key=lambda reg: self.next_use(self.allocated_registers[reg]))
+
+    def lowest_usable_register(self) -> int:
+        """Take the lowest numbered free register.
+
+        Reusing low registers keeps the number of registers a function touches down,
+        each of which has to be saved and restored by the function's prelude and epilog."""
+        reg = min(self.usable_registers)
+        self.usable_registers.remove(reg)
+        return reg
+
+    def use_register(self, reg: int, v_reg: Register):
+        """Assign a virtual register to a real register, marking it as the most recently used."""
+        self.allocated_registers[reg] = v_reg
+        self.allocated_registers.move_to_end(reg)
 
     def allocate_register(self, v_reg: Register,
                           source: ir_object.IRObject,
                           excludes: List[int]) -> int:
         """Allocate a register. If it is already allocated this is a noop."""
-        if v_reg in self.register_states:
-            state, data = self.register_states[v_reg]
-            if state is RegisterState.Allocated:
-                # alread allocated: Just return
-                return data
-            if state is RegisterState.Spilled:
-                #  we need to recover the register, find a register to load,
-                #  If all registers are taken: emit spill before load instruction
-                if self.usable_registers:
-                    register = self.usable_registers.pop()
-                else:
-                    register = self.least_active_register(excludes)
-                    spilled_virtual = self.allocated_registers[register]
-                    source.insert_pre_instrs(self.emit_spill(spilled_virtual, register))
-
-                self.allocated_registers[register] = v_reg
-                source.insert_pre_instrs(self.emit_load(v_reg, register))
-                return register
+        reg = self.allocated_virtuals.get(v_reg.reg)
+        if reg is not None:
+            # alread allocated: Just return
+            self.allocated_registers.move_to_end(reg)
+            return reg
+
+        if v_reg.reg in self.spilled_virtuals:
+            #  we need to recover the register, find a register to load,
+            #  If all registers are taken: emit spill before load instruction
+            if self.usable_registers:
+                register = self.lowest_usable_register()
+            else:
+                register = self.least_active_register(excludes)
+                spilled_virtual = self.allocated_registers[register]
+                source.insert_pre_instrs(self.emit_spill(spilled_virtual, register))
+
+            self.use_register(register, v_reg)
+            source.insert_pre_instrs(self.emit_load(v_reg, register))
+            return register
+
+        if v_reg.reg in self.dead_virtuals:
             # we're trying to use this register but we said it was dead earlier
             raise InternalCompileException(f"Register {v_reg} is marked dead but wants to be allocated.")
 
-        # register not in our state table, allocate it for the first time
+        # register not seen before, allocate it for the first time
         if self.usable_registers:
             # best case, there is a register free to use.
-            reg = self.usable_registers.pop()
-            self.register_states[v_reg] = (RegisterState.Allocated, reg)
-            self.allocated_registers[reg] = v_reg
-            return reg
+            register = self.lowest_usable_register()
+        else:
+            register = self.least_active_register(excludes)
+            spilled_virtual = self.allocated_registers[register]
+            source.insert_pre_instrs(self.emit_spill(spilled_virtual, register))
 
-        register = self.least_active_register(excludes)
-        spilled_virtual = self.allocated_registers[register]
-        source.insert_pre_instrs(self.emit_spill(spilled_virtual, register))
-        self.register_states[v_reg] = (RegisterState.Allocated, register)
-        self.allocated_registers[register] = v_reg
+        self.allocated_virtuals[v_reg.reg] = register
+        self.use_register(register, v_reg)
         return register
 
 
-def mark_last_usages(code: Sequence[ir_object.IRObject]):
-    """Scans backwards over instructions, marking registers when they are last used."""
+def find_register_uses(touched: Sequence[List[Register]]) -> Dict[int, List[int]]:
+    """Find the indexes of the instructions that use each virtual register.
+
+    Registers are keyed by number, hashing the Register objects themselves is a lot slower.
+
+    :param touched: The touched registers of each instruction."""
+    uses = {}
+
+    for idx, registers in enumerate(touched):
+        for v_reg in registers:
+            reg = v_reg.reg
+            if reg in uses:
+                uses[reg].append(idx)
+            else:
+                uses[reg] = [idx]
+
+    return uses
+
+
+def find_closing_registers(touched: Sequence[List[Register]]) -> List[List[Register]]:
+    """Scans backwards over instructions, finding the registers each instruction is the last user of.
+
+    :param touched: The touched registers of each instruction.
+    :returns: The registers that are dead after each instruction."""
+    closings = [[] for _ in touched]
     spotted_registers = set()
 
     # by scanning backwards, the first time we see a variable
     # is the last time it's used in the execution order
-    for instr in reversed(code):
-        for v_reg in instr.touched_registers:
-            if v_reg not in spotted_registers:
-                instr.closing_registers.add(v_reg)
-                spotted_registers.add(v_reg)
+    for closing, registers in zip(reversed(closings), reversed(touched)):
+        for v_reg in registers:
+            reg = v_reg.reg
+            if reg not in spotted_registers:
+                closing.append(v_reg)
+                spotted_registers.add(reg)
+
+    return closings
 
 
-def allocate(reg_count: int, code: Sequence[ir_object.IRObject]) -> AllocationState:
+def rename_register(arg: Any, renames: Dict[int, int]) -> Any:
+    """Get an argument with any virtual register in it renamed."""
+    if type(arg) is Dereference:
+        to = rename_register(arg.to, renames)
+        return arg if to is arg.to else Dereference(to, arg.size)
+    if type(arg) is Register and arg.reg in renames:
+        return Register(renames[arg.reg], arg.size, arg.sign)
+    return arg
+
+
+def coalesce_moves(code: List[ir_object.IRObject]):
+    """Remove moves between virtual registers whose lifetimes only meet at the move.
+
+    When the source of a move is last used by it and the destination is first used by it,
+    the destination is renamed to the source and the move is dropped.
+    """
+    uses = find_register_uses([i.touched_registers for i in code])
+
+    # registers in inline asm are never cloned or renamed, so leave them be
+    pinned = {reg.reg for i in code if type(i) is MachineInstr for reg in i.touched_registers}
+
+    renames: Dict[int, int] = {}
+    coalesced: Set[int] = set()
+
+    for idx, i in enumerate(code):
+        if (type(i) is Mov and type(i.to) is Register and type(i.from_) is Register
+                and i.to.size == i.from_.size and i.to.reg != i.from_.reg
+                and i.to.reg not in pinned and i.from_.reg not in pinned
+                and uses[i.from_.reg][-1] == idx and uses[i.to.reg][0] == idx
+                and not i.pre_instructions):
+            # the source may itself have been renamed, so take its final name
+            renames[i.to.reg] = renames.get(i.from_.reg, i.from_.reg)
+            coalesced.add(idx)
+
+    # only the instructions that use a renamed register need to be visited
+    for idx in {idx for reg in renames for idx in uses[reg]}:
+        i = code[idx]
+        for attr in i.touched_regs:
+            arg = getattr(i, attr)
+            renamed = rename_register(arg, renames)
+            if renamed is not arg:
+                setattr(i, attr, renamed)
+
+    if coalesced:
+        code[:] = [i for idx, i in enumerate(code) if idx not in coalesced]
+
+
+def allocate(reg_count: int, code: List[ir_object.IRObject]) -> AllocationState:
     """Allocate registers for an ∞ register IR.
     returns the allocation state to be used in further processing.
     """
 
     state = AllocationState(reg_count)
 
-    # update each instruction to mark where registers become unused
-    mark_last_usages(code)
+    coalesce_moves(code)
 
+    # clone the registers of each instruction so that each instruction has it's own instance of a command
     for i in code:
+        i.clone_regs()
+
+    # registers compare by number, so the clones are found once for both passes
+    touched = [i.touched_registers for i in code]
+
+    state.register_uses = find_register_uses(touched)
+
+    # find where registers become unused
+    closings = find_closing_registers(touched)
+
+    for position, (i, registers, closing) in enumerate(zip(code, touched, closings)):
+        state.position = position
         regs_for_instruction = []
 
-        # clone the registers of the instruction so that each instruction has it's own instance of a command
-        i.clone_regs()
-        for v_reg in i.touched_registers:
+        for v_reg in registers:
             # bad stuff could happen if the register has already been allocated in this instruction
             # or we're using a shared instance of the register objects
             assert v_reg.physical_register is None
@@ -229,11 +349,12 @@ def allocate(reg_count: int, code: Sequence[ir_object.IRObject]) -> AllocationSt
 
             # ensure that this hw-reg isn't swapped out mid-instruction
             regs_for_instruction.append(reg)
+            state.used_registers.add(reg)
             v_reg.physical_register = reg
 
         # mark the closing registers as free
         # prevents unneeded spills
-        for v_reg in i.closing_registers:
+        for v_reg in closing:
             state.free_register(v_reg)
 
     return state
@@ -1,3 +1,5 @@
+from copy import deepcopy
+from functools import lru_cache
 from typing import List
 
 from wewcompiler.objects import builder
@@ -10,8 +12,24 @@ def parse_with_semantics(text: str, semantics: type=None) -> List[base.Statement
     return lang.parse(text, semantics=semantics())
 
 
-def parse_source(inp: str) -> List[base.StatementObject]:
-    return parse_with_semantics(inp, builder.WewSemantics)
+@lru_cache(maxsize=32)
+def parse_cached(text: str, semantics: type) -> List[base.StatementObject]:
+    """Parse a file with given semantics, remembering the result for the same source text.
+
+    Compiling mutates the objects it is given, the result must be copied before use.
+    """
+    return parse_with_semantics(text, semantics)
+
+
+def parse_source(inp: str, cached: bool=True) -> List[base.StatementObject]:
+    """Parse a source file.
+
+    Copying a cached parse is far cheaper than parsing again, so parses are cached unless
+    the source is only ever parsed once.
+    """
+    if not cached:
+        return parse_with_semantics(inp, builder.WewSemantics)
+    return deepcopy(parse_cached(inp, builder.WewSemantics))
 
 
 def compile_source(inp: str) -> base.Compiler:
@@ -1,5 +1,6 @@
-from itertools import count
-from typing import Optional, Tuple, Iterable
+from functools import lru_cache
+from itertools import accumulate, count
+from typing import Optional, Tuple, Iterable, List
 
 import colorama
 
@@ -15,6 +16,12 @@ def add_line_once(line: str, counter: Iterable[int]) -> str:
     return f"{next(counter):>3}| {line}"
 
 
+@lru_cache(maxsize=8)
+def line_offsets(buffer) -> List[int]:
+    """Offsets of the start of each line of a source buffer, found once per buffer."""
+    return [0, *accumulate(map(len, buffer.get_lines()))]
+
+
 class BaseObject:
     """Base class of compilables."""
 
@@ -65,11 +72,11 @@ class BaseObject:
         startl, endl = info.line, info.endline
         startp, endp = info.pos, info.endpos
 
-        source = info.buffer.get_lines()
+        offsets = line_offsets(info.buffer)
         # startp and endp are offsets from the start
         # calculate their offsets from the line they are on.
-        startp = startp - sum(map(len, source[:startl]))
-        endp -= sum(map(len, source[:endl]))
+        startp -= offsets[startl]
+        endp -= offsets[endl]
 
         return startp + 1, endp
 
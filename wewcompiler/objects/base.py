@@ -1,9 +1,10 @@
 """Core compilation objects."""
 
+from collections import defaultdict
 from contextlib import contextmanager
 from functools import wraps
 from itertools import accumulate
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, DefaultDict, Dict, List, Optional, Tuple, Union
 
 from tatsu.ast import AST
 
@@ -149,7 +150,7 @@ def fully_qualified_name(obj: BaseObject, name: str) -> str:
 class Scope(StatementObject, IdentifierScope):
     """A object that contains variables that can be looked up."""
 
-    __slots__ = ("_vars", "size", "body", "used_hw_regs")
+    __slots__ = ("_vars", "size", "body", "used_hw_regs", "spill_vars")
 
     def __init__(self, body: List[StatementObject], *, ast: Optional[AST] = None):
         super().__init__(ast=ast)
@@ -158,6 +159,9 @@ class Scope(StatementObject, IdentifierScope):
         self.body = body
         self.used_hw_regs = []
 
+        #: variables to spill registers into, by index of the spill slot
+        self.spill_vars: List[Variable] = []
+
     @property
     def vars(self) -> Dict[str, Variable]:
         return self._vars
@@ -183,11 +187,12 @@ class Scope(StatementObject, IdentifierScope):
 
     def add_spill_vars(self, n: int):
         """Insert variables to spill registers into."""
-        for i in range(n):
+        self.spill_vars = [
             self.declare_variable(
                 f"spill-var-{i}",
                 types.Int.fromsize(8)
-            )
+            ) for i in range(n)
+        ]
 
 
 class FunctionDecl(Scope):
@@ -277,21 +282,28 @@ class Compiler(IdentifierScope):
 
     __slots__ = ("data", "_vars", "compiled_objects",
                  "waiting_coros", "data_identifiers",
-                 "spill_size", "_objects", "unique_counter")
+                 "spill_size", "spill_vars", "_objects", "unique_counter",
+                 "defined_names")
 
     def __init__(self):
         self._vars: Dict[str, Variable] = {}
         self.compiled_objects: List[StatementObject] = []
-        self.waiting_coros: Dict[str, List[BaseObject]] = {}
+        self.waiting_coros: DefaultDict[str, List[BaseObject]] = defaultdict(list)
         self.data: List[Union[bytes, List[Variable]]] = []
         self.data_identifiers: Dict[str, int] = {}
         self.spill_size = 0
 
+        #: variables to spill registers into, by index of the spill slot
+        self.spill_vars: List[Variable] = []
+
         self._objects: List[Tuple[StatementObject, Any]] = []
 
         #: counter for generating unique identifiers
         self.unique_counter = 0
 
+        #: global names defined since the waiting list was last checked
+        self.defined_names: List[str] = []
+
     @property
     def vars(self) -> Dict[str, Variable]:
         return self._vars
@@ -312,11 +324,12 @@ class Compiler(IdentifierScope):
 
     def add_spill_vars(self, n: int):
         self.spill_size = 8 * n
-        for i in range(n):
+        self.spill_vars = [
             self.declare_variable(
                 f"global-spill-{i}",
                 types.Int.fromsize(8)  # always make an 8 byte spill
-            )  # MAYBE: give sizes to spill vars
+            ) for i in range(n)
+        ]  # MAYBE: give sizes to spill vars
 
     def init_variable(self, var: Variable):
         var.global_offset = DataReference(var.name)
@@ -325,6 +338,7 @@ class Compiler(IdentifierScope):
 
     def own_variable(self, var: Variable):
         self.vars[var.name] = var
+        self.defined_names.append(var.name)
 
     def add_string(self, string: str) -> Variable:
         """Add a string to the object table.
@@ -378,8 +392,7 @@ class Compiler(IdentifierScope):
         :param name: The name to wait on.
         :param obj: The object that should sleep.
         """
-        coros = self.waiting_coros.setdefault(name, [])
-        coros.append(obj)
+        self.waiting_coros[name].append(obj)
 
     def add_object(self, obj: BaseObject):
         """Add an object to be compiled by the current compilation.
@@ -440,14 +453,13 @@ class Compiler(IdentifierScope):
         while self._objects:
             obj, to_send = self._objects.pop()
             if self.run_over(obj, to_send):
-                # after completing a compilation, run over the waiting list,
-                # adding any objects that are satisfied back on to the compilation list
-                for name in tuple(self.waiting_coros.keys()):
-                    var = self.lookup_variable(name)
-                    if var is None:
-                        continue
-                    to_wake = self.waiting_coros.pop(name)
-                    self._objects.extend((o, var) for o in to_wake)
+                # after completing a compilation, wake any objects waiting on a name that has
+                # since been defined, adding them back on to the compilation list
+                for name in self.defined_names:
+                    to_wake = self.waiting_coros.pop(name, None)
+                    if to_wake is not None:
+                        self._objects.extend((o, self.vars[name]) for o in to_wake)
+                self.defined_names.clear()
                 if not isinstance(obj, ModDecl):
                     self.compiled_objects.append(obj)
 
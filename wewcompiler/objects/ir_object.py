@@ -1,5 +1,6 @@
 from enum import IntEnum
-from typing import Optional, Union, Iterable, List, Set, Any
+from functools import lru_cache
+from typing import Optional, Union, Iterable, List, Any
 from dataclasses import dataclass, field
 
 from wewcompiler.objects.variable import Variable, DataReference
@@ -28,14 +29,18 @@ class AllocatedRegister:
     physical_register: Optional[int] = None
 
 
-@dataclass
 class Register:
     """A generic register for an infinite register machine."""
 
-    reg: int
-    size: int
-    sign: bool = False
-    physical_register: Optional[int] = None
+    __slots__ = ("reg", "size", "sign", "physical_register")
+
+    # not a dataclass as slots can't be mixed with field defaults,
+    # and eq, hash and repr are all overridden anyway
+    def __init__(self, reg: int, size: int, sign: bool = False, physical_register: Optional[int] = None):
+        self.reg = reg
+        self.size = size
+        self.sign = sign
+        self.physical_register = physical_register
 
     def resize(self, new_size: int = None, new_sign: bool = None) -> 'Register':
         """Get a resized copy of this register."""
@@ -82,6 +87,12 @@ class Immediate:
     __repr__ = __str__
 
 
+@lru_cache(maxsize=256)
+def cached_immediate(val: int, size: int) -> Immediate:
+    """Get a shared immediate, immediates are never mutated so can be reused between instructions."""
+    return Immediate(val, size)
+
+
 @dataclass
 class Dereference:
     """Represents dereferencing a register, address or immediate value."""
@@ -118,9 +129,6 @@ class IRObject:
     #: list of instructions to be run before this instruction
     pre_instructions: List[Any] = field(default_factory=list, init=False, repr=False)
 
-    #: regisers that are dead after this instruction
-    closing_registers: Set[Register] = field(default_factory=set, init=False, repr=False)
-
     parent: Optional[BaseObject] = field(default=None, init=False, repr=False)
 
     def clone_regs(self):
@@ -138,9 +146,16 @@ class IRObject:
     @property
     def touched_registers(self) -> Iterable[Register]:
         """Get the registers that this instruction reads from and writes to."""
-        attrs = self.touched_regs
-        regs = (filter_reg(getattr(self, i)) for i in attrs)
-        return list(filter(None, regs))
+        # the allocator calls this twice for every instruction, so this is an inlined
+        # version of filter_reg using exact type checks (nothing subclasses Register or Dereference)
+        regs = []
+        for attr in self.touched_regs:
+            reg = getattr(self, attr)
+            if type(reg) is Dereference:
+                reg = reg.to
+            if type(reg) is Register:
+                regs.append(reg)
+        return regs
 
     touched_regs = ()
 
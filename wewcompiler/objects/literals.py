@@ -257,7 +257,9 @@ class ArrayLiteral(ExpressionObject):
         """
 
         if self.var is None:
-            self.var = ctx.declare_unique_variable(await self.type)
+            # our type is a pointer, the hidden local needs to be big enough to hold the elements
+            storage_type = types.Array((await self.type).to, len(self.exprs) + self.float_size)
+            self.var = ctx.declare_unique_variable(storage_type)
             self.var.lvalue_is_rvalue = True
 
         if (isinstance(self.first_elem, ArrayLiteral) and (not isinstance((await self.type).to, types.Pointer))):
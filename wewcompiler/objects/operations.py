@@ -460,6 +460,8 @@ class BinaryExpression(ExpressionObject):
 
 class BinAddOp(BinaryExpression):
 
+    __slots__ = ()
+
     _compat_types = (  # maybe follow algebraic rules to reduce repetition
         (('+', '-'), (Pointer, Int), Pointer),
         (('+', '-'), (Int, Pointer), Pointer),
@@ -518,6 +520,8 @@ class BinMulOp(BinaryExpression):
 
     Emits a signed operation of the rhs of a division is signed."""
 
+    __slots__ = ()
+
     _compat_types = ((('*', '/', '%'), (Int, Int), Int), )
 
     @property
@@ -553,6 +557,8 @@ class BinShiftOp(BinaryExpression):
 
     Emits a signed operation if shifting left and any side of the expression is signed."""
 
+    __slots__ = ()
+
     _compat_types = ((('>>', '<<'), (Int, Int), Int), )
 
     @property
@@ -588,6 +594,8 @@ class BinShiftOp(BinaryExpression):
 class BinRelOp(BinaryExpression):
     """Binary relational comparison operation."""
 
+    __slots__ = ()
+
     _compat_types = ((('<=', '>=', '<', '>', '==', '!='), (Int, Int), Int),
                      (('<=', '>=', '<', '>', '==', '!='), (Pointer, Pointer),
                       Int))
@@ -630,6 +638,8 @@ class BinRelOp(BinaryExpression):
 class BitwiseOp(BinaryExpression):
     """Binary bitwise operators."""
 
+    __slots__ = ()
+
     _compat_types = ((("|", "^", "&"), (Int, Int), Int), )
 
     @property
@@ -28,6 +28,8 @@ class Type(BaseObject):
 
 class Void(Type):
 
+    __slots__ = ()
+
     # void types have zero size
     size = 0
 
@@ -8,6 +8,9 @@ from wewcompiler.objects.types import Type
 @dataclass
 class DataReference:
     """Index to some named object, the exact location to be resolved later."""
+
+    __slots__ = ("name",)
+
     name: str
 
 
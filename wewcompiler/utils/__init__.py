@@ -1,7 +1,17 @@
-from typing import Iterable
+from itertools import compress
+from operator import not_
+from typing import Callable, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
 
 def add_line_count(lines: Iterable[str], counter: Iterable[int]) -> Iterable[str]:
     return (f"{next(counter):>3}| {lv}" for lv in lines)
 
 def strip_newlines(strs: Iterable[str]) -> Iterable[str]:
     return (i.rstrip("\n\r") for i in strs)
+
+def partition(pred: Callable[[T], bool], items: Iterable[T]) -> Tuple[List[T], List[T]]:
+    """Split items into those that satisfy a predicate and those that do not, preserving order."""
+    items = list(items)
+    flags = list(map(pred, items))
+    return list(compress(items, flags)), list(compress(items, map(not_, flags)))
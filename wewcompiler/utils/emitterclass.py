@@ -7,18 +7,18 @@ class EmitterMeta(type):
     """Creates an 'emitter' class.
 
     Methods that have the 'emits' decorator used will become classmethods
-    and their name and object will be included in the class attribute 'emitters'
-    which will be a dict mapping method names to methods.
+    and will be included in the class attribute 'emitters' which will be a
+    dict mapping the types they emit for to methods.
 
     Example usage:
 
     class MyEmitter(metaclass=Emitter):
 
-        @emits("something")
+        @emits(int)
         def my_method(cls, attr):
             return str(attr)
 
-    MyEmitter.emitters  # = {'something': MyEmitter.my_method}
+    MyEmitter.emitters  # = {int: MyEmitter.my_method}
     """
 
     def __new__(mcs, name, bases, dict):
@@ -48,8 +48,9 @@ class Emitter(metaclass=EmitterMeta):
 
     @classmethod
     def method_for(cls, obj):
-        if type(obj) in cls.emitters:
-            return cls.emitters[type(obj)]
+        method = cls.emitters.get(type(obj))
+        if method is not None:
+            return method
 
         default = getattr(cls, "default", None)
         if default is None:
@@ -58,11 +59,11 @@ class Emitter(metaclass=EmitterMeta):
 
 
 
-def emits(name: str):
-    """Decorator that marks a function for what it will desugar.
+def emits(typ: type):
+    """Decorator that marks a function for the type of object it will emit for.
     Also marks as a classmethod.
     """
     def deco(fn):
-        fn.emitter_for = name
+        fn.emitter_for = typ
         return classmethod(fn)
     return deco